@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.services.auth_service import require_admin
+from app.services.slow_query_log import slow_query_log
+from app.services.profiling import ProfiledRoute, profile_store
+
+router = APIRouter(route_class=ProfiledRoute)
+
+@router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500, description="返回数量限制"),
+    name: Optional[str] = Query(None, description="按查询名称过滤"),
+    current_user: dict = Depends(require_admin)
+):
+    """获取最近的慢查询及执行计划（需要管理员权限）"""
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "queries": slow_query_log.entries(limit=limit, name=name)
+    }
+
+@router.delete("/admin/slow-queries")
+async def clear_slow_queries(current_user: dict = Depends(require_admin)):
+    """清空内存中的慢查询记录（需要管理员权限）"""
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
+
+@router.get("/admin/profiles")
+async def get_profiles(
+    limit: int = Query(50, ge=1, le=500, description="返回数量限制"),
+    path: Optional[str] = Query(None, description="按请求路径过滤"),
+    current_user: dict = Depends(require_admin)
+):
+    """最近的请求剖析结果（各阶段耗时）（需要管理员权限）"""
+    return profile_store.list(limit=limit, path=path)
+
+@router.get("/admin/profiles/flame/{name}", response_class=PlainTextResponse)
+async def get_profile_flame(name: str, current_user: dict = Depends(require_admin)):
+    """下载调用栈采样文件（折叠栈格式，可用 flamegraph.pl 或 speedscope 查看）（需要管理员权限）"""
+    content = profile_store.flame(name)
+    if content is None:
+        raise HTTPException(status_code=404, detail="剖析文件不存在")
+    return PlainTextResponse(content)
+
+@router.delete("/admin/profiles")
+async def clear_profiles(current_user: dict = Depends(require_admin)):
+    """清空内存中的剖析结果（需要管理员权限）"""
+    profile_store.clear()
+    return {"message": "Profiles cleared"}
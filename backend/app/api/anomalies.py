@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from app.services.anomaly_detector import anomaly_detector
+from app.services.auth_service import get_current_user
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+@router.get("/anomalies")
+async def get_anomalies(
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    src_ip: Optional[str] = Query(None, description="源IP地址"),
+    app_name: Optional[str] = Query(None, description="应用名称"),
+    metric: Optional[str] = Query(None, description="指标: bytes, sessions"),
+    min_score: Optional[float] = Query(None, ge=0, description="最小偏离倍数"),
+    limit: int = Query(100, ge=1, le=1000, description="返回数量限制"),
+    current_user: dict = Depends(get_current_user)
+):
+    """获取检测到的流量异常（按时间倒序）"""
+    try:
+        return await run_in_threadpool(
+            anomaly_detector.list_anomalies,
+            start_time=start_time, end_time=end_time, src_ip=src_ip, app_name=app_name,
+            metric=metric, min_score=min_score, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取异常列表失败: {str(e)}")
+
+@router.get("/anomalies/status")
+async def get_anomaly_status(current_user: dict = Depends(get_current_user)):
+    """异常检测状态（水位、基线数量、处理行数）"""
+    return anomaly_detector.status()
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.schemas import BatchQueryRequest
+from app.services.auth_service import get_current_user
+from app.services.query_batch import BATCH_CONCURRENCY, run_batch, validate_batch
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+@router.post("/query/batch")
+async def batch_query(batch: BatchQueryRequest, current_user: dict = Depends(get_current_user)):
+    """批量查询：共享过滤条件，并发执行多个子查询，按完成顺序以NDJSON流式返回"""
+    filters = batch.filters.model_dump()
+    try:
+        queries = validate_batch(filters, [query.model_dump() for query in batch.queries])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        run_batch(queries, filters, current_user["username"], batch.concurrency or BATCH_CONCURRENCY),
+        media_type="application/x-ndjson"
+    )
@@ -0,0 +1,116 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+from app.models.schemas import SavedQueryCreate, SavedQueryUpdate
+from app.services.auth_service import get_current_user
+from app.services.saved_queries import SnapshotUnavailable, saved_query_service, validate_query
+from app.services.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+def _get_query(query_id: int) -> dict:
+    query = saved_query_service.store.get_by_id(query_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail="保存的查询不存在")
+    return query
+
+def _check_owner(query: dict, current_user: dict) -> None:
+    """只有创建者和管理员可以修改或删除"""
+    if current_user["role"] != "admin" and query.get("owner") != current_user["username"]:
+        raise HTTPException(status_code=403, detail="只能修改自己创建的查询")
+
+@router.get("/saved-queries")
+async def list_saved_queries(current_user: dict = Depends(get_current_user)):
+    """获取保存的查询列表（含最新快照时间和下一次执行时间）"""
+    queries = await run_in_threadpool(saved_query_service.store.all)
+    return [saved_query_service.describe(query) for query in queries]
+
+@router.post("/saved-queries")
+async def create_saved_query(query_data: SavedQueryCreate, current_user: dict = Depends(get_current_user)):
+    """保存查询，可选设置调度"""
+    fields = query_data.model_dump(exclude={"name"})
+    fields["filters"] = {k: v for k, v in fields["filters"].items() if v}
+    try:
+        validate_query(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    fields.update(owner=current_user["username"], created_at=now, updated_at=now)
+    try:
+        query = await run_in_threadpool(saved_query_service.store.create, query_data.name, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return saved_query_service.describe(query)
+
+@router.put("/saved-queries/{query_id}")
+async def update_saved_query(query_id: int, query_data: SavedQueryUpdate,
+                             current_user: dict = Depends(get_current_user)):
+    """更新保存的查询"""
+    query = _get_query(query_id)
+    _check_owner(query, current_user)
+
+    fields = query_data.model_dump(exclude_unset=True)
+    if fields.get("filters") is not None:
+        fields["filters"] = {k: v for k, v in fields["filters"].items() if v}
+    try:
+        validate_query(dict(query, **fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    fields["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    updated = await run_in_threadpool(saved_query_service.store.update, query_id, fields)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="保存的查询不存在")
+    return saved_query_service.describe(updated)
+
+@router.delete("/saved-queries/{query_id}")
+async def delete_saved_query(query_id: int, current_user: dict = Depends(get_current_user)):
+    """删除保存的查询及其快照"""
+    query = _get_query(query_id)
+    _check_owner(query, current_user)
+    await run_in_threadpool(saved_query_service.store.delete, query_id)
+    await run_in_threadpool(saved_query_service.snapshots.delete, query_id)
+    return {"message": "Saved query deleted successfully"}
+
+@router.get("/saved-queries/{query_id}/result")
+async def get_saved_query_result(
+    query_id: int,
+    refresh: bool = Query(False, description="忽略已有快照，立即重新执行"),
+    current_user: dict = Depends(get_current_user)
+):
+    """获取最新的结果快照及其时效；没有快照时立即执行一次"""
+    _get_query(query_id)
+    try:
+        result = await run_in_threadpool(saved_query_service.result, query_id, refresh)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (ConnectionError, SnapshotUnavailable) as e:
+        raise HTTPException(status_code=503, detail=f"执行保存的查询失败: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"执行保存的查询失败: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="保存的查询不存在")
+    return result
+
+@router.post("/saved-queries/{query_id}/run")
+async def run_saved_query(query_id: int, current_user: dict = Depends(get_current_user)):
+    """立即执行并保存快照"""
+    _get_query(query_id)
+    try:
+        meta = await run_in_threadpool(saved_query_service.run, query_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=f"执行保存的查询失败: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"执行保存的查询失败: {str(e)}")
+    if meta is None:
+        raise HTTPException(status_code=404, detail="保存的查询不存在")
+    return meta
+
+@router.get("/saved-queries/{query_id}/snapshots")
+async def list_snapshots(query_id: int, current_user: dict = Depends(get_current_user)):
+    """获取快照列表（按时间倒序）"""
+    _get_query(query_id)
+    return await run_in_threadpool(saved_query_service.snapshots.list, query_id)
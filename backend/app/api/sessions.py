@@ -1,10 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from app.models.schemas import SessionResponse, QueryParams, StatsResponse
+from app.models.schemas import SessionResponse, QueryParams, StatsResponse, FlowDetailResponse, GraphResponse
 from app.services.clickhouse_service import get_clickhouse_service
 from app.services.auth_service import get_current_user
+from app.services.http_cache import compute_etag, conditional_response
+from app.services.profiling import ProfiledRoute, iter_in_request_thread, phase
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
+
+# 流式导出时每块包含的行数
+EXPORT_CHUNK_ROWS = 500
+
+async def _check_etag(request: Request, response: Response,
+                      start_time: Optional[str] = None, end_time: Optional[str] = None) -> Optional[Response]:
+    """按数据水位（指定时间窗口时为窗口内的水位）计算ETag，未变化时返回304响应"""
+    watermark = await run_in_threadpool(get_clickhouse_service().data_watermark, start_time, end_time)
+    return conditional_response(request, response, compute_etag(request, watermark))
 
 @router.get("/sessions", response_model=SessionResponse)
 async def get_sessions(
@@ -21,7 +34,8 @@ async def get_sessions(
     """获取会话数据列表"""
     try:
         offset = (page - 1) * size
-        result = get_clickhouse_service().get_session_data(
+        result = await run_in_threadpool(
+            get_clickhouse_service().get_session_data,
             start_time=start_time,
             end_time=end_time,
             src_ip=src_ip,
@@ -29,23 +43,77 @@ async def get_sessions(
             protocol=protocol,
             app_name=app_name,
             limit=size,
-            offset=offset
+            offset=offset,
+            user=current_user["username"]
         )
         
-        return SessionResponse(
-            data=result["data"],
-            total=result["total"],
-            page=page,
-            size=size
-        )
+        with phase("validation"):
+            return SessionResponse(
+                data=result["data"],
+                total=result["total"],
+                page=page,
+                size=size
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取会话数据失败: {str(e)}")
 
+@router.get("/sessions/flow", response_model=FlowDetailResponse)
+async def get_flow_detail(
+    src_ip: str = Query(..., description="源IP地址"),
+    dst_ip: str = Query(..., description="目标IP地址"),
+    src_port: int = Query(..., ge=0, le=65535, description="源端口"),
+    dst_port: int = Query(..., ge=0, le=65535, description="目标端口"),
+    protocol: int = Query(..., ge=0, le=255, description="协议号"),
+    first_seen: str = Query(..., description="首包时间 (YYYY-MM-DD HH:MM:SS)"),
+    window: int = Query(5, ge=1, le=60, description="关联会话时间窗口（分钟）"),
+    related_limit: int = Query(20, ge=1, le=100, description="每类关联会话数量限制"),
+    current_user: dict = Depends(get_current_user)
+):
+    """会话下钻：按五元组获取单条会话及其关联会话"""
+    try:
+        result = await run_in_threadpool(
+            get_clickhouse_service().get_flow_detail,
+            src_ip=src_ip,
+            dst_ip=dst_ip,
+            src_port=src_port,
+            dst_port=dst_port,
+            protocol=protocol,
+            first_seen=first_seen,
+            window_minutes=window,
+            related_limit=related_limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取会话详情失败: {str(e)}")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return result
+
 @router.get("/sessions/stats")
-async def get_session_stats(current_user: dict = Depends(get_current_user)):
+async def get_session_stats(
+    request: Request,
+    response: Response,
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    compare_to: Optional[str] = Query(None, description="环比偏移，如 1h、1d、7d、1w"),
+    current_user: dict = Depends(get_current_user)
+):
     """获取会话统计信息"""
     try:
-        stats = get_clickhouse_service().get_session_stats()
+        # 对比查询涉及两个窗口，按全表水位判断
+        window = (None, None) if compare_to else (start_time, end_time)
+        not_modified = await _check_etag(request, response, *window)
+        if not_modified:
+            return not_modified
+
+        if compare_to:
+            return await run_in_threadpool(get_clickhouse_service().compare_session_stats, start_time, end_time, compare_to)
+
+        stats = await run_in_threadpool(get_clickhouse_service().get_session_stats, start_time=start_time, end_time=end_time)
 
         # 返回原始数据，让前端处理格式化
         return {
@@ -56,17 +124,33 @@ async def get_session_stats(current_user: dict = Depends(get_current_user)):
             "last_activity": stats["last_activity"]
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
 @router.get("/sessions/top-ips")
 async def get_top_ips(
+    request: Request,
+    response: Response,
     limit: int = Query(10, ge=1, le=50, description="返回数量限制"),
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    compare_to: Optional[str] = Query(None, description="环比偏移，如 1h、1d、7d、1w"),
     current_user: dict = Depends(get_current_user)
 ):
     """获取热门IP统计"""
     try:
-        top_ips = get_clickhouse_service().get_top_ips(limit=limit)
+        # 对比查询涉及两个窗口，按全表水位判断
+        window = (None, None) if compare_to else (start_time, end_time)
+        not_modified = await _check_etag(request, response, *window)
+        if not_modified:
+            return not_modified
+
+        if compare_to:
+            return await run_in_threadpool(get_clickhouse_service().compare_top_ips, start_time, end_time, compare_to, limit=limit)
+
+        top_ips = await run_in_threadpool(get_clickhouse_service().get_top_ips, limit=limit, start_time=start_time, end_time=end_time)
 
         # 返回原始数据，前端处理格式化
         formatted_ips = []
@@ -79,23 +163,110 @@ async def get_top_ips(
 
         return formatted_ips
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取热门IP失败: {str(e)}")
 
 @router.get("/sessions/protocols")
-async def get_protocol_stats(current_user: dict = Depends(get_current_user)):
+async def get_protocol_stats(
+    request: Request,
+    response: Response,
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    compare_to: Optional[str] = Query(None, description="环比偏移，如 1h、1d、7d、1w"),
+    current_user: dict = Depends(get_current_user)
+):
     """获取协议统计信息"""
     try:
-        protocols = get_clickhouse_service().get_protocol_stats()
+        # 对比查询涉及两个窗口，按全表水位判断
+        window = (None, None) if compare_to else (start_time, end_time)
+        not_modified = await _check_etag(request, response, *window)
+        if not_modified:
+            return not_modified
+
+        if compare_to:
+            return await run_in_threadpool(get_clickhouse_service().compare_protocol_stats, start_time, end_time, compare_to)
+
+        protocols = await run_in_threadpool(get_clickhouse_service().get_protocol_stats, start_time=start_time, end_time=end_time)
         return protocols
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取协议统计失败: {str(e)}")
 
+@router.get("/sessions/histogram")
+async def get_traffic_histogram(
+    request: Request,
+    response: Response,
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    src_ip: Optional[str] = Query(None, description="源IP地址"),
+    dst_ip: Optional[str] = Query(None, description="目标IP地址"),
+    protocol: Optional[str] = Query(None, description="协议类型"),
+    app_name: Optional[str] = Query(None, description="应用名称"),
+    interval: Optional[str] = Query(None, description="桶宽，如 5m、1h；不指定时自动选择"),
+    current_user: dict = Depends(get_current_user)
+):
+    """获取流量时间分布（会话数、字节数、包数）"""
+    try:
+        not_modified = await _check_etag(request, response, start_time, end_time)
+        if not_modified:
+            return not_modified
+
+        return await run_in_threadpool(
+            get_clickhouse_service().get_traffic_histogram,
+            start_time=start_time, end_time=end_time, src_ip=src_ip, dst_ip=dst_ip,
+            protocol=protocol, app_name=app_name, interval=interval
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取流量分布失败: {str(e)}")
+
+@router.get("/sessions/graph", response_model=GraphResponse)
+async def get_host_graph(
+    request: Request,
+    response: Response,
+    start_time: Optional[str] = Query(None, description="开始时间 (YYYY-MM-DD HH:MM:SS)"),
+    end_time: Optional[str] = Query(None, description="结束时间 (YYYY-MM-DD HH:MM:SS)"),
+    src_ip: Optional[str] = Query(None, description="源IP地址"),
+    dst_ip: Optional[str] = Query(None, description="目标IP地址"),
+    protocol: Optional[str] = Query(None, description="协议类型"),
+    app_name: Optional[str] = Query(None, description="应用名称"),
+    max_edges: int = Query(300, ge=1, le=5000, description="最多返回的边数（按权重取前N条）"),
+    max_degree: int = Query(25, ge=1, le=500, description="每个节点最多保留的出边/入边数"),
+    weight: str = Query("bytes", description="边权重: bytes, sessions"),
+    subnet_v4: Optional[int] = Query(None, ge=0, le=32, description="按IPv4子网合并节点的前缀长度，如 24"),
+    subnet_v6: Optional[int] = Query(None, ge=0, le=128, description="按IPv6子网合并节点的前缀长度，如 64"),
+    current_user: dict = Depends(get_current_user)
+):
+    """获取主机通信图（节点与按源/目的聚合的边）"""
+    try:
+        not_modified = await _check_etag(request, response, start_time, end_time)
+        if not_modified:
+            return not_modified
+
+        return await run_in_threadpool(
+            get_clickhouse_service().get_host_graph,
+            start_time=start_time, end_time=end_time, src_ip=src_ip, dst_ip=dst_ip,
+            protocol=protocol, app_name=app_name, max_edges=max_edges, max_degree=max_degree,
+            weight=weight, subnet_v4=subnet_v4, subnet_v6=subnet_v6
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取通信图失败: {str(e)}")
+
 @router.get("/sessions/time-range")
-async def get_time_range(current_user: dict = Depends(get_current_user)):
+async def get_time_range(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """获取数据的时间范围"""
     try:
-        time_range = get_clickhouse_service().get_time_range()
+        not_modified = await _check_etag(request, response)
+        if not_modified:
+            return not_modified
+
+        time_range = await run_in_threadpool(get_clickhouse_service().get_time_range)
         return time_range
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取时间范围失败: {str(e)}")
@@ -109,32 +280,35 @@ async def export_sessions(
     dst_ip: Optional[str] = Query(None),
     protocol: Optional[str] = Query(None),
     app_name: Optional[str] = Query(None),
+    raw: bool = Query(False, description="时间输出为毫秒时间戳、tcp_flags输出为整数，由客户端格式化"),
     current_user: dict = Depends(get_current_user)
 ):
     """导出会话数据"""
     try:
         # 获取所有符合条件的数据
-        result = get_clickhouse_service().get_session_data(
+        block = await run_in_threadpool(
+            get_clickhouse_service().export_sessions,
             start_time=start_time,
             end_time=end_time,
             src_ip=src_ip,
             dst_ip=dst_ip,
             protocol=protocol,
             app_name=app_name,
-            limit=10000,  # 限制最多导出10000条
-            offset=0
+            limit=10000  # 限制最多导出10000条
         )
         
         if format.lower() == "json":
-            from fastapi.responses import JSONResponse
-            return JSONResponse(content=result["data"])
+            return StreamingResponse(iter_in_request_thread(block.iter_json(raw=raw, chunk_rows=EXPORT_CHUNK_ROWS)),
+                                     media_type="application/json")
         
         # 对于CSV和Excel格式，这里返回数据，实际项目中可以生成文件
         return {
             "message": f"导出{format}格式数据",
-            "total_records": len(result["data"]),
-            "data": result["data"][:10]  # 只返回前10条作为预览
+            "total_records": len(block),
+            "data": block[:10].to_dicts(raw=raw)  # 只返回前10条作为预览
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"导出数据失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"导出数据失败: {str(e)}")
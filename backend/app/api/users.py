@@ -1,24 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from datetime import timedelta
 from app.models.schemas import User, UserCreate, UserUpdate, LoginRequest, Token
 from app.services.auth_service import (
-    authenticate_user, create_access_token, get_current_user, 
-    require_admin, UserService, ACCESS_TOKEN_EXPIRE_MINUTES
+    authenticate_user_async, create_access_token, get_current_user, 
+    require_admin, UserService, ACCESS_TOKEN_EXPIRE_MINUTES, token_cache
 )
+from app.services.password_service import HashQueueFull, login_rate_limiter
+from app.services.profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.post("/auth/login", response_model=Token)
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request):
     """用户登录"""
-    user = authenticate_user(login_data.username, login_data.password)
+    client_host = request.client.host if request.client else ""
+    rate_key = f"{login_data.username}|{client_host}"
+    retry_after = login_rate_limiter.retry_after(rate_key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="登录失败次数过多，请稍后再试",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    try:
+        user = await authenticate_user_async(login_data.username, login_data.password)
+    except HashQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="登录请求过多，请稍后再试",
+            headers={"Retry-After": "1"},
+        )
     if not user:
+        login_rate_limiter.record_failure(rate_key)
         raise HTTPException(
             status_code=401,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    login_rate_limiter.reset(rate_key)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["username"]}, expires_delta=access_token_expires
@@ -40,11 +62,16 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
         "created_at": current_user["created_at"]
     }
 
+@router.get("/auth/token-cache")
+async def get_token_cache_stats(current_user: dict = Depends(require_admin)):
+    """获取令牌缓存统计（需要管理员权限）"""
+    return token_cache.stats()
+
 @router.get("/users")
 async def get_users(current_user: dict = Depends(get_current_user)):
     """获取用户列表（所有登录用户都可以查看）"""
     try:
-        users = UserService.get_all_users()
+        users = await run_in_threadpool(UserService.get_all_users)
         return users
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取用户列表失败: {str(e)}")
@@ -56,7 +83,9 @@ async def create_user(
 ):
     """创建新用户（需要管理员权限）"""
     try:
-        new_user = UserService.create_user(
+        # 用户文件写入在线程池中执行，避免阻塞事件循环
+        new_user = await run_in_threadpool(
+            UserService.create_user,
             username=user_data.username,
             email=user_data.email,
             password=user_data.password,
@@ -76,7 +105,8 @@ async def update_user(
 ):
     """更新用户信息（需要管理员权限）"""
     try:
-        updated_user = UserService.update_user(
+        updated_user = await run_in_threadpool(
+            UserService.update_user,
             user_id=user_id,
             email=user_data.email,
             role=user_data.role
@@ -94,7 +124,7 @@ async def delete_user(
 ):
     """删除用户（需要管理员权限）"""
     try:
-        result = UserService.delete_user(user_id)
+        result = await run_in_threadpool(UserService.delete_user, user_id)
         return result
     except HTTPException:
         raise
@@ -115,12 +145,10 @@ async def get_user(
         )
     
     try:
-        users = UserService.get_all_users()
-        for user in users:
-            if user["id"] == user_id:
-                return user
-        
-        raise HTTPException(status_code=404, detail="用户不存在")
+        user = UserService.get_user_by_id(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="用户不存在")
+        return user
     except HTTPException:
         raise
     except Exception as e:
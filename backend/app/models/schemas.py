@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class SessionData(BaseModel):
@@ -49,6 +49,12 @@ class SessionResponse(BaseModel):
     page: int
     size: int
 
+class FlowDetailResponse(BaseModel):
+    flow: SessionData
+    related_host_pair: List[SessionData]
+    related_domain: List[SessionData]
+    window_minutes: int
+
 class User(BaseModel):
     id: Optional[int] = None
     username: str
@@ -83,4 +89,77 @@ class StatsResponse(BaseModel):
     avg_speed: str
     security_score: int
     unique_ips: int
-    last_activity: str
\ No newline at end of file
+    last_activity: str
+
+class SavedQueryFilters(BaseModel):
+    src_ip: Optional[str] = None
+    dst_ip: Optional[str] = None
+    protocol: Optional[str] = None
+    app_name: Optional[str] = None
+
+class SavedQueryCreate(BaseModel):
+    name: str
+    kind: str  # sessions / stats / top_ips / protocols
+    range: Optional[str] = None  # 相对时间范围，如 24h、7d；与 start_time/end_time 二选一
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    filters: SavedQueryFilters = SavedQueryFilters()
+    limit: int = Field(1000, ge=1, le=10000)
+    schedule: Optional[str] = None  # 间隔（如 1h）或每日时间（如 07:30）
+    retention: Optional[int] = Field(None, ge=1, le=100)
+
+class SavedQueryUpdate(BaseModel):
+    kind: Optional[str] = None
+    range: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    filters: Optional[SavedQueryFilters] = None
+    limit: Optional[int] = Field(None, ge=1, le=10000)
+    schedule: Optional[str] = None
+    retention: Optional[int] = Field(None, ge=1, le=100)
+
+class GraphNode(BaseModel):
+    id: str
+    sessions: int
+    bytes_out: int
+    bytes_in: int
+    degree_out: int
+    degree_in: int
+
+class GraphEdge(BaseModel):
+    source: str
+    target: str
+    sessions: int
+    bytes: int
+    packets: int
+    ports: List[int]
+    port_count: int
+    first_seen: str
+    last_seen: str
+
+class GraphResponse(BaseModel):
+    nodes: List[GraphNode]
+    edges: List[GraphEdge]
+    total_edges: int
+    truncated: bool
+    weight: str
+    subnet_v4: Optional[int] = None
+    subnet_v6: Optional[int] = None
+
+class BatchFilters(BaseModel):
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    src_ip: Optional[str] = None
+    dst_ip: Optional[str] = None
+    protocol: Optional[str] = None
+    app_name: Optional[str] = None
+
+class BatchQuery(BaseModel):
+    name: str
+    kind: str  # sessions / stats / top_ips / protocols / histogram / graph
+    params: Dict[str, Any] = {}
+
+class BatchQueryRequest(BaseModel):
+    filters: BatchFilters = BatchFilters()
+    queries: List[BatchQuery]
+    concurrency: Optional[int] = None
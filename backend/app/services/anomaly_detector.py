@@ -0,0 +1,507 @@
+import gzip
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.services.clickhouse_service import get_clickhouse_service
+from app.services.leader_lock import LeaderLock
+from app.services.metrics import registry
+from app.services.session_block import format_ms
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_ENABLED = os.getenv("ANOMALY_ENABLED", "True").lower() == "true"
+ANOMALY_TABLE = os.getenv("ANOMALY_TABLE", "traffic_anomalies")
+ANOMALY_STATE_FILE = os.getenv("ANOMALY_STATE_FILE", "anomaly_state.json.gz")
+# 检测间隔（秒）、等待迟到数据的时间（秒）、首次启动时回溯的分钟数、每次查询最多处理的分钟数
+ANOMALY_TICK = float(os.getenv("ANOMALY_TICK", "30"))
+ANOMALY_LAG_SECONDS = int(os.getenv("ANOMALY_LAG_SECONDS", "120"))
+ANOMALY_BACKFILL_MINUTES = int(os.getenv("ANOMALY_BACKFILL_MINUTES", "60"))
+ANOMALY_MAX_MINUTES_PER_QUERY = int(os.getenv("ANOMALY_MAX_MINUTES_PER_QUERY", "30"))
+# EWMA平滑系数、告警阈值（偏离基线的标准差倍数）、基线生效前需要的样本数
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "6"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+# 每分钟字节数/会话数低于该值时不告警，避免小流量的噪声
+ANOMALY_MIN_BYTES = int(os.getenv("ANOMALY_MIN_BYTES", "1048576"))
+ANOMALY_MIN_SESSIONS = int(os.getenv("ANOMALY_MIN_SESSIONS", "50"))
+# 最多跟踪的 (src_ip, app_name) 数、检查点间隔（秒）、内存中保留的最近告警数
+ANOMALY_MAX_KEYS = int(os.getenv("ANOMALY_MAX_KEYS", "200000"))
+ANOMALY_CHECKPOINT_INTERVAL = float(os.getenv("ANOMALY_CHECKPOINT_INTERVAL", "300"))
+ANOMALY_RECENT = int(os.getenv("ANOMALY_RECENT", "1000"))
+# 写入告警表失败时暂存等待重试的告警数上限
+ANOMALY_MAX_PENDING = int(os.getenv("ANOMALY_MAX_PENDING", "10000"))
+
+MINUTE_MS = 60 * 1000
+METRICS = ("bytes", "sessions")
+
+
+class BaselineTable:
+    """按 (src_ip, app_name) 维护的在线基线，全部存放在定长数组中
+
+    每个指标保存按分钟（无流量的分钟计为0）的EWMA均值/方差，以及只按有流量的分钟计算的
+    EWMA水平；每个键另有活跃率（有流量分钟的EWMA比例）。间歇出现的键按不活跃的比例以其
+    通常的突发量作为波动下限，避免每次出现都被判为异常；每分钟都有流量的键不受该下限影响。
+    每个键占用固定的几十字节；超过上限时淘汰最久未出现的键，内存有界。
+    """
+
+    __slots__ = ("alpha", "max_keys", "index", "keys", "free", "mean", "var", "level", "activity",
+                 "samples", "last")
+
+    def __init__(self, alpha: float = ANOMALY_ALPHA, max_keys: int = ANOMALY_MAX_KEYS):
+        self.alpha = alpha
+        self.max_keys = max_keys
+        self.index: Dict[Tuple[str, str], int] = {}
+        self.keys: List[Optional[Tuple[str, str]]] = []
+        self.free: List[int] = []
+        # 均值、方差和水平按 slot * len(METRICS) + metric 排列
+        self.mean = array("d")
+        self.var = array("d")
+        self.level = array("d")
+        self.activity = array("d")
+        self.samples = array("L")
+        self.last = array("q")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _slot(self, key: Tuple[str, str], minute: int) -> int:
+        slot = self.index.get(key)
+        if slot is not None:
+            return slot
+        if len(self.index) >= self.max_keys:
+            self._evict()
+        if self.free:
+            slot = self.free.pop()
+            self.keys[slot] = key
+            for pos in range(slot * len(METRICS), (slot + 1) * len(METRICS)):
+                self.mean[pos] = self.var[pos] = self.level[pos] = 0.0
+            self.activity[slot] = 0.0
+            self.samples[slot] = 0
+            self.last[slot] = minute - 1
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.mean.extend([0.0] * len(METRICS))
+            self.var.extend([0.0] * len(METRICS))
+            self.level.extend([0.0] * len(METRICS))
+            self.activity.append(0.0)
+            self.samples.append(0)
+            self.last.append(minute - 1)
+        self.index[key] = slot
+        return slot
+
+    def _evict(self) -> None:
+        """淘汰最久未出现的10%的键"""
+        slots = sorted(self.index.values(), key=self.last.__getitem__)
+        for slot in slots[:max(1, len(slots) // 10)]:
+            del self.index[self.keys[slot]]
+            self.keys[slot] = None
+            self.free.append(slot)
+
+    def _update(self, pos: int, value: float) -> None:
+        alpha = self.alpha
+        diff = value - self.mean[pos]
+        incr = alpha * diff
+        self.mean[pos] += incr
+        self.var[pos] = (1 - alpha) * (self.var[pos] + diff * incr)
+        self.level[pos] += alpha * (value - self.level[pos])
+
+    def observe(self, key: Tuple[str, str], minute: int, values: Tuple[float, ...],
+                threshold: float, min_samples: int) -> List[Tuple[int, float, float, float]]:
+        """用一分钟的观测值打分并更新基线，返回超过阈值的 (指标序号, 基线均值, 波动, 偏离倍数)；
+        有流量的分钟数达到 min_samples 后才开始打分"""
+        slot = self._slot(key, minute)
+        width = len(METRICS)
+        base = slot * width
+
+        # 上次出现之后没有流量的分钟按0补齐：连续k个0的EWMA更新有闭式解，代价与间隔无关
+        gap = minute - self.last[slot] - 1
+        samples = self.samples[slot]
+        if samples and gap > 0:
+            decay = (1 - self.alpha) ** gap
+            for pos in range(base, base + width):
+                mean = self.mean[pos]
+                self.var[pos] = decay * (self.var[pos] + mean * mean * (1 - decay))
+                self.mean[pos] = mean * decay
+            self.activity[slot] *= decay
+        inactive = 1.0 - self.activity[slot]
+
+        scored = []
+        for m, value in enumerate(values):
+            pos = base + m
+            mean = self.mean[pos]
+            # 波动下限：避免平稳基线产生极大的偏离倍数；间歇出现的键按不活跃比例以通常的突发量为下限
+            std = max(math.sqrt(self.var[pos]), 0.1 * mean, inactive * self.level[pos], 1.0)
+            score = (value - mean) / std
+            if samples >= min_samples and score > threshold:
+                scored.append((m, mean, std, score))
+                # 异常值截断后再更新基线，避免一次突发把基线抬高
+                value = mean + threshold * std
+            if samples:
+                self._update(pos, value)
+            else:
+                self.mean[pos] = self.level[pos] = value
+
+        self.activity[slot] = self.activity[slot] + self.alpha * (1.0 - self.activity[slot]) if samples else 1.0
+        self.samples[slot] = samples + 1
+        self.last[slot] = minute
+        return scored
+
+    def to_state(self) -> Dict[str, Any]:
+        slots = sorted(self.index.values())
+        width = len(METRICS)
+        return {
+            "keys": [list(self.keys[s]) for s in slots],
+            "mean": [self.mean[s * width + m] for s in slots for m in range(width)],
+            "var": [self.var[s * width + m] for s in slots for m in range(width)],
+            "level": [self.level[s * width + m] for s in slots for m in range(width)],
+            "activity": [self.activity[s] for s in slots],
+            "samples": [self.samples[s] for s in slots],
+            "last": [self.last[s] for s in slots],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], alpha: float = ANOMALY_ALPHA,
+                   max_keys: int = ANOMALY_MAX_KEYS) -> "BaselineTable":
+        table = cls(alpha, max_keys)
+        table.keys = [tuple(key) for key in state["keys"]]
+        table.index = {key: slot for slot, key in enumerate(table.keys)}
+        table.mean = array("d", state["mean"])
+        table.var = array("d", state["var"])
+        table.level = array("d", state["level"])
+        # 旧检查点没有活跃率时按不活跃处理（与之前的波动下限一致），随后续观测自动修正
+        table.activity = array("d", state.get("activity") or [0.0] * len(table.keys))
+        table.samples = array("L", state["samples"])
+        table.last = array("q", state["last"])
+        return table
+
+
+class AnomalyDetector:
+    """流量异常检测：后台线程按水位增量读取每分钟的 (src_ip, app_name) 聚合，与在线基线比较后输出告警
+
+    只查询水位之后的完整分钟，不重复扫描历史数据；基线和水位定期写入检查点，重启后从水位继续。
+    水位与基线同时推进，告警先进入待写入队列，写入告警表失败时下次重试，不会重复处理同一分钟。
+    多worker部署时通过文件锁只由一个进程运行。
+    """
+
+    def __init__(self, state_file: str = ANOMALY_STATE_FILE):
+        self.state_file = state_file
+        self.baselines = BaselineTable()
+        self.watermark: Optional[int] = None  # 下一个待处理的分钟（分钟序号，不含）
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=ANOMALY_RECENT)
+        self.pending: Deque[Dict[str, Any]] = deque(maxlen=ANOMALY_MAX_PENDING)
+        self.leader = LeaderLock(state_file + ".lock", "Anomaly detector")
+        self.table_ready = False
+        self.rows_processed = 0
+        self.anomalies_total = 0
+        self.last_tick_ms = 0.0
+        self.last_error: Optional[str] = None
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 检查点 ----
+
+    def load_checkpoint(self) -> bool:
+        """从检查点恢复基线和水位；参数变化或文件损坏时重新开始"""
+        try:
+            with gzip.open(self.state_file, "rb") as f:
+                state = json.loads(f.read())
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Failed to read anomaly checkpoint: {e}")
+            return False
+        if state.get("alpha") != ANOMALY_ALPHA or state.get("metrics") != list(METRICS):
+            logger.info("Anomaly detector parameters changed, ignoring checkpoint")
+            return False
+        with self._lock:
+            self.baselines = BaselineTable.from_state(state["baselines"])
+            self.watermark = state["watermark"]
+            self.pending.extend(state.get("pending") or [])
+        logger.info(f"Anomaly detector restored {len(self.baselines)} baselines at {format_ms(self.watermark * MINUTE_MS)}")
+        return True
+
+    def save_checkpoint(self) -> None:
+        """写入检查点（先写临时文件再rename）"""
+        with self._lock:
+            if self.watermark is None:
+                return
+            state = {"alpha": ANOMALY_ALPHA, "metrics": list(METRICS), "watermark": self.watermark,
+                     "pending": list(self.pending), "baselines": self.baselines.to_state()}
+        directory = os.path.dirname(self.state_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".anomaly-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(json.dumps(state).encode("utf-8"))
+            os.replace(tmp_path, self.state_file)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._last_checkpoint = time.monotonic()
+
+    # ---- 检测 ----
+
+    def _ensure_table(self) -> None:
+        if self.table_ready:
+            return
+        service = get_clickhouse_service()
+        service._query("anomaly_ddl", f"""
+        CREATE TABLE IF NOT EXISTS {service.database}.{ANOMALY_TABLE} (
+            timestamp UInt64,
+            detected_at UInt64,
+            src_ip String,
+            app_name String,
+            metric LowCardinality(String),
+            value Float64,
+            baseline Float64,
+            std Float64,
+            score Float64
+        ) ENGINE = MergeTree
+        PARTITION BY intDiv(timestamp, 86400000)
+        ORDER BY (timestamp, src_ip)
+        """)
+        self.table_ready = True
+
+    def _ready_minute(self) -> Optional[int]:
+        """已完整写入的最后一分钟之后的分钟序号（按数据的最新时间减去迟到等待时间）"""
+        time_range = get_clickhouse_service().freshness.time_range()
+        if not time_range or time_range[1] is None:
+            return None
+        return (time_range[1] - ANOMALY_LAG_SECONDS * 1000) // MINUTE_MS
+
+    def process(self, rows: List[Tuple[int, str, str, int, int]],
+                until: Optional[int] = None) -> List[Dict[str, Any]]:
+        """处理按分钟排序的聚合行 (分钟序号, src_ip, app_name, 会话数, 字节数)，返回告警；
+        指定 until 时在同一把锁内把水位推进到 until，并把告警加入待写入队列"""
+        detected_at = int(time.time() * 1000)
+        minimums = (ANOMALY_MIN_BYTES, ANOMALY_MIN_SESSIONS)
+        anomalies = []
+        with self._lock:
+            observe = self.baselines.observe
+            for minute, src_ip, app_name, sessions, n_bytes in rows:
+                values = (n_bytes, sessions)
+                for m, mean, std, score in observe((src_ip, app_name), minute, values,
+                                                   ANOMALY_THRESHOLD, ANOMALY_MIN_SAMPLES):
+                    if values[m] < minimums[m]:
+                        continue
+                    anomalies.append({
+                        "timestamp": minute * MINUTE_MS,
+                        "detected_at": detected_at,
+                        "src_ip": src_ip,
+                        "app_name": app_name,
+                        "metric": METRICS[m],
+                        "value": float(values[m]),
+                        "baseline": round(mean, 2),
+                        "std": round(std, 2),
+                        "score": round(score, 2)
+                    })
+            self.rows_processed += len(rows)
+            self.anomalies_total += len(anomalies)
+            self.recent.extend(anomalies)
+            if until is not None:
+                self.watermark = until
+                dropped = len(self.pending) + len(anomalies) - ANOMALY_MAX_PENDING
+                if dropped > 0:
+                    logger.error(f"Anomaly queue full, dropping {dropped} unwritten anomalies")
+                self.pending.extend(anomalies)
+        return anomalies
+
+    def _flush(self) -> None:
+        """写入待写入队列中的告警；失败时保留在队列中并抛出异常，下次重试"""
+        with self._lock:
+            batch = list(self.pending)
+        if not batch:
+            return
+        self._emit(batch)
+        with self._lock:
+            for _ in range(min(len(batch), len(self.pending))):
+                self.pending.popleft()
+
+    def _emit(self, anomalies: List[Dict[str, Any]]) -> None:
+        service = get_clickhouse_service()
+        columns = ("timestamp", "detected_at", "src_ip", "app_name", "metric", "value", "baseline", "std", "score")
+        service._query("anomaly_insert",
+                       f"INSERT INTO {service.database}.{ANOMALY_TABLE} ({', '.join(columns)}) VALUES",
+                       [tuple(a[c] for c in columns) for a in anomalies])
+        for a in anomalies:
+            logger.warning(f"Traffic anomaly: {a['src_ip']} {a['app_name'] or '-'} {a['metric']}="
+                           f"{a['value']:.0f} baseline={a['baseline']:.0f} score={a['score']}")
+
+    def step(self) -> int:
+        """处理水位之后所有已完整的分钟，返回处理的分钟数"""
+        service = get_clickhouse_service()
+        if not service.available:
+            return 0
+        self._ensure_table()
+        # 先重试上次写入失败的告警，失败时不处理新的分钟
+        self._flush()
+        ready = self._ready_minute()
+        if ready is None:
+            return 0
+        if self.watermark is None:
+            self.watermark = ready - ANOMALY_BACKFILL_MINUTES
+
+        processed = 0
+        while self.watermark < ready and not self._stop.is_set():
+            start = self.watermark
+            end = min(ready, start + ANOMALY_MAX_MINUTES_PER_QUERY)
+            rows = service._query("anomaly_minutes", f"""
+            SELECT intDiv(timestamp, {MINUTE_MS}) as minute, src_ip, app_name, count(), sum(total_bytes)
+            FROM {service.database}.{service.table}
+            WHERE timestamp >= {start * MINUTE_MS} AND timestamp < {end * MINUTE_MS}
+            GROUP BY minute, src_ip, app_name
+            ORDER BY minute
+            """)
+            self.process(rows, until=end)
+            processed += end - start
+            self._flush()
+        return processed
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if self.leader.acquire():
+                if self.watermark is None:
+                    self.load_checkpoint()
+                started = time.perf_counter()
+                try:
+                    self.step()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"Anomaly detection failed: {e}")
+                self.last_tick_ms = round((time.perf_counter() - started) * 1000, 1)
+                if time.monotonic() - self._last_checkpoint >= ANOMALY_CHECKPOINT_INTERVAL:
+                    self._checkpoint()
+            self._stop.wait(ANOMALY_TICK)
+
+    def _checkpoint(self) -> None:
+        try:
+            self.save_checkpoint()
+        except Exception as e:
+            logger.error(f"Failed to write anomaly checkpoint: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None or not ANOMALY_ENABLED:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="anomaly-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.leader.held:
+            self._checkpoint()
+        self.leader.release()
+
+    # ---- 查询 ----
+
+    def list_anomalies(self,
+                       start_time: Optional[str] = None,
+                       end_time: Optional[str] = None,
+                       src_ip: Optional[str] = None,
+                       app_name: Optional[str] = None,
+                       metric: Optional[str] = None,
+                       min_score: Optional[float] = None,
+                       limit: int = 100) -> List[Dict[str, Any]]:
+        """从告警表查询异常（任一worker均可查询）；ClickHouse不可用时返回本进程内存中的最近告警"""
+        if metric is not None and metric not in METRICS:
+            raise ValueError(f"无效的指标: {metric}，应为 {', '.join(METRICS)}")
+        service = get_clickhouse_service()
+        bounds = service._time_bounds(start_time, end_time)
+        if not service.available:
+            with self._lock:
+                items = [a for a in reversed(self.recent)
+                         if (not src_ip or a["src_ip"] == src_ip)
+                         and (not app_name or a["app_name"] == app_name)
+                         and (not metric or a["metric"] == metric)
+                         and (min_score is None or a["score"] >= min_score)]
+            return [dict(a, timestamp=format_ms(a["timestamp"]), detected_at=format_ms(a["detected_at"]))
+                    for a in items[:limit]]
+
+        conditions = []
+        params: Dict[str, Any] = {}
+        if bounds:
+            conditions.append(f"timestamp BETWEEN {bounds[0]} AND {bounds[1]}")
+        for field, value in (("src_ip", src_ip), ("app_name", app_name), ("metric", metric)):
+            if value:
+                conditions.append(f"{field} = %({field})s")
+                params[field] = value
+        if min_score is not None:
+            conditions.append(f"score >= {float(min_score)}")
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        self._ensure_table()
+        rows = service._query("anomaly_list", f"""
+        SELECT timestamp, detected_at, src_ip, app_name, metric, value, baseline, std, score
+        FROM {service.database}.{ANOMALY_TABLE}
+        {where}
+        ORDER BY timestamp DESC, score DESC
+        LIMIT {int(limit)}
+        """, params)
+        return [
+            {
+                "timestamp": format_ms(row[0]),
+                "detected_at": format_ms(row[1]),
+                "src_ip": row[2],
+                "app_name": row[3],
+                "metric": row[4],
+                "value": row[5],
+                "baseline": row[6],
+                "std": row[7],
+                "score": row[8]
+            }
+            for row in rows
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            watermark = self.watermark
+            keys = len(self.baselines)
+            pending = len(self.pending)
+        return {
+            "enabled": ANOMALY_ENABLED,
+            "leader": self.leader.held and self._thread is not None,
+            "watermark": format_ms(watermark * MINUTE_MS) if watermark is not None else None,
+            "baselines": keys,
+            "max_baselines": ANOMALY_MAX_KEYS,
+            "rows_processed": self.rows_processed,
+            "anomalies_total": self.anomalies_total,
+            "pending": pending,
+            "last_tick_ms": self.last_tick_ms,
+            "last_error": self.last_error
+        }
+
+    def metrics(self) -> List[str]:
+        status = self.status()
+        return [
+            "# HELP anomaly_baselines Online baselines tracked by the anomaly detector",
+            "# TYPE anomaly_baselines gauge",
+            f"anomaly_baselines {status['baselines']}",
+            "# HELP anomaly_rows_processed_total Per-minute aggregate rows consumed by the anomaly detector",
+            "# TYPE anomaly_rows_processed_total counter",
+            f"anomaly_rows_processed_total {status['rows_processed']}",
+            "# HELP anomaly_detected_total Anomalies emitted since start",
+            "# TYPE anomaly_detected_total counter",
+            f"anomaly_detected_total {status['anomalies_total']}",
+        ]
+
+
+anomaly_detector = AnomalyDetector()
+registry.register_collector(anomaly_detector.metrics)
@@ -1,12 +1,19 @@
-import json
+import hashlib
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from app.services.cache import TTLCache
+from app.services.metrics import registry
+from app.services.request_context import set_current_user
+from app.services.profiling import current_profile, phase
+from app.services.password_service import hash_password, verify_and_update, password_hasher
+from app.services.user_store import UserStore
 
-# 简化认证，不使用bcrypt
 security = HTTPBearer()
 
 # JWT配置
@@ -14,65 +21,60 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# 已验证令牌缓存：键为令牌的SHA-256，值为解析出的用户；条目不会晚于令牌exp过期
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "4096")),
+    ttl=TOKEN_CACHE_TTL
+)
+registry.register_cache("token", token_cache)
+
 # 用户数据文件
-USERS_FILE = "users.json"
+USERS_FILE = os.getenv("USERS_FILE", "users.json")
 
-def load_users():
-    """从文件加载用户数据"""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    
-    # 如果文件不存在或读取失败，返回默认用户
-    default_users = {
-        "admin": {
-            "id": 1,
-            "username": "admin",
-            "email": "admin@example.com",
-            "role": "admin",
-            "password": "admin123",
-            "created_at": "2024-01-01 10:00:00"
-        },
-        "analyst": {
-            "id": 2,
-            "username": "analyst",
-            "email": "analyst@example.com",
-            "role": "user",
-            "password": "analyst123",
-            "created_at": "2024-01-02 11:30:00"
-        }
+# 文件不存在或读取失败时使用的默认用户
+DEFAULT_USERS = {
+    "admin": {
+        "id": 1,
+        "username": "admin",
+        "email": "admin@example.com",
+        "role": "admin",
+        "password": "admin123",
+        "created_at": "2024-01-01 10:00:00"
+    },
+    "analyst": {
+        "id": 2,
+        "username": "analyst",
+        "email": "analyst@example.com",
+        "role": "user",
+        "password": "analyst123",
+        "created_at": "2024-01-02 11:30:00"
     }
-    save_users(default_users)
-    return default_users
-
-def save_users(users_db):
-    """保存用户数据到文件"""
-    try:
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users_db, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving users: {e}")
+}
 
 # 加载用户数据库
-fake_users_db = load_users()
+user_store = UserStore(USERS_FILE, default_users=DEFAULT_USERS)
+
+def _invalidate_token_cache(event: str, user: Optional[dict]):
+    """用户变更时使相关令牌缓存失效"""
+    if event == "reload":
+        token_cache.clear()
+    elif event in ("update", "delete") and user:
+        token_cache.discard_where(lambda key, cached: cached["username"] == user["username"])
+
+user_store.subscribe(_invalidate_token_cache)
 
 def verify_password(plain_password: str, stored_password: str) -> bool:
     """验证密码"""
-    return plain_password == stored_password
+    return verify_and_update(plain_password, stored_password)[0]
 
 def get_password_hash(password: str) -> str:
-    """生成密码哈希（这里直接返回明文）"""
-    return password
+    """生成密码哈希"""
+    return hash_password(password)
 
 def get_user(username: str):
     """获取用户信息"""
-    if username in fake_users_db:
-        user_dict = fake_users_db[username]
-        return user_dict
-    return None
+    return user_store.get_by_username(username)
 
 def authenticate_user(username: str, password: str):
     """验证用户身份"""
@@ -83,6 +85,16 @@ def authenticate_user(username: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(username: str, password: str):
+    """验证用户身份，密码校验在哈希线程池中执行，必要时重新计算哈希"""
+    user = get_user(username)
+    verified, new_hash = await password_hasher.verify(password, user["password"] if user else None)
+    if not user or not verified:
+        return False
+    if new_hash:
+        await run_in_threadpool(user_store.update, user["id"], {"password": new_hash})
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建访问令牌"""
     to_encode = data.copy()
@@ -96,7 +108,23 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """验证JWT令牌"""
-    token = credentials.credentials
+    with phase("auth"):
+        user = _verify_token(credentials.credentials)
+    profile = current_profile()
+    if profile is not None:
+        profile.authorize(user)
+    return user
+
+def _verify_token(token: str) -> dict:
+    cache_key = hashlib.sha256(token.encode()).digest()
+
+    # 检测其他worker对用户数据的修改（触发缓存失效），然后查缓存
+    user_store.refresh()
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        set_current_user(cached["username"])
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -110,9 +138,20 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     except JWTError:
         raise credentials_exception
     
+    # 读取用户前记下数据版本：读取期间用户被修改（失效事件已发出）时不写缓存，避免缓存旧数据
+    version = user_store.version
     user = get_user(username=username)
     if user is None:
         raise credentials_exception
+    # 缓存和返回的用户不含密码哈希
+    user = {key: value for key, value in user.items() if key != "password"}
+
+    ttl = TOKEN_CACHE_TTL
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0 and user_store.version == version:
+        token_cache.set(cache_key, user, ttl=ttl)
+    set_current_user(user["username"])
     return user
 
 def get_current_user(user: dict = Depends(verify_token)):
@@ -128,102 +167,83 @@ def require_admin(user: dict = Depends(get_current_user)):
         )
     return user
 
+def _public_user(user_data: dict) -> dict:
+    """去除密码等敏感字段"""
+    return {
+        "id": user_data["id"],
+        "username": user_data["username"],
+        "email": user_data["email"],
+        "role": user_data["role"],
+        "created_at": user_data["created_at"]
+    }
+
 class UserService:
     @staticmethod
     def get_all_users():
         """获取所有用户"""
-        return [
-            {
-                "id": user_data["id"],
-                "username": user_data["username"],
-                "email": user_data["email"],
-                "role": user_data["role"],
-                "created_at": user_data["created_at"]
-            }
-            for user_data in fake_users_db.values()
-        ]
+        return [_public_user(user_data) for user_data in user_store.all()]
+
+    @staticmethod
+    def get_user_by_id(user_id: int):
+        """按ID获取用户"""
+        user_data = user_store.get_by_id(user_id)
+        return _public_user(user_data) if user_data else None
     
     @staticmethod
     def create_user(username: str, email: str, password: str, role: str = "user"):
         """创建用户"""
-        global fake_users_db
-        
-        if username in fake_users_db:
+        try:
+            user_data = user_store.create(username, {
+                "email": email,
+                "role": role,
+                "password": get_password_hash(password),
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            })
+        except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already exists"
             )
         
-        user_id = max([user["id"] for user in fake_users_db.values()]) + 1
-        
-        fake_users_db[username] = {
-            "id": user_id,
-            "username": username,
-            "email": email,
-            "role": role,
-            "password": password,  # 存储明文密码
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # 保存到文件
-        save_users(fake_users_db)
-        
-        return {
-            "id": user_id,
-            "username": username,
-            "email": email,
-            "role": role,
-            "created_at": fake_users_db[username]["created_at"]
-        }
+        return _public_user(user_data)
     
     @staticmethod
     def update_user(user_id: int, email: str = None, role: str = None):
         """更新用户"""
-        global fake_users_db
-        
-        for username, user_data in fake_users_db.items():
-            if user_data["id"] == user_id:
-                if email:
-                    user_data["email"] = email
-                if role:
-                    user_data["role"] = role
-                
-                # 保存到文件
-                save_users(fake_users_db)
-                
-                return {
-                    "id": user_data["id"],
-                    "username": user_data["username"],
-                    "email": user_data["email"],
-                    "role": user_data["role"],
-                    "created_at": user_data["created_at"]
-                }
+        fields = {}
+        if email:
+            fields["email"] = email
+        if role:
+            fields["role"] = role
+
+        user_data = user_store.update(user_id, fields)
+        if user_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
         
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+        return _public_user(user_data)
     
     @staticmethod
     def delete_user(user_id: int):
         """删除用户"""
-        global fake_users_db
-        
-        for username, user_data in fake_users_db.items():
-            if user_data["id"] == user_id:
-                if username == "admin":
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Cannot delete admin user"
-                    )
-                del fake_users_db[username]
-                
-                # 保存到文件
-                save_users(fake_users_db)
-                
-                return {"message": "User deleted successfully"}
+        user_data = user_store.get_by_id(user_id)
+        if user_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        if user_data["username"] == "admin":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot delete admin user"
+            )
+
+        if user_store.delete(user_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
         
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
\ No newline at end of file
+        return {"message": "User deleted successfully"}
@@ -0,0 +1,92 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class ClickHousePool:
+    """ClickHouse连接池：clickhouse_driver.Client 不是线程安全的，每个查询独占一个连接"""
+
+    def __init__(self, factory: Callable[[], Any], size: int = 4, timeout: float = 30.0):
+        self._factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No idle ClickHouse connection within {self.timeout}s")
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，用完自动归还；出错时断开以便下次重连"""
+        client = self._acquire()
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield client
+        except Exception:
+            disconnect = getattr(client, "disconnect", None)
+            if disconnect is not None:
+                try:
+                    disconnect()
+                except Exception:
+                    pass
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(client)
+
+    def warm(self) -> int:
+        """预先建立全部连接，返回成功建立的数量"""
+        clients: List[Any] = []
+        try:
+            for _ in range(self.size):
+                client = self._acquire()
+                clients.append(client)
+                client.execute("SELECT 1")
+        except Exception as e:
+            logger.warning(f"ClickHouse pool warmup stopped after {len(clients)} connections: {e}")
+        finally:
+            for client in clients:
+                self._idle.put(client)
+        return len(clients)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize()
+            }
@@ -5,13 +5,61 @@ except ImportError:
     CLICKHOUSE_AVAILABLE = False
     Client = None
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
 import logging
+import re
 from datetime import datetime
 import os
+import time
+
+from app.services.cache import TTLCache
+from app.services.clickhouse_pool import ClickHousePool
+from app.services.freshness import FreshnessTracker
+from app.services.page_prefetch import PagePrefetcher
+from app.services.session_block import COMPACT_SELECT, SessionBlock, format_ip, format_ms, ip_num_sql
+from app.services.metrics import (
+    registry, clickhouse_query_duration, clickhouse_queries, clickhouse_rows_read,
+    clickhouse_bytes_read, clickhouse_rows_returned, clickhouse_queries_in_flight
+)
+from app.services.profiling import add_phase, phase, request_thread
+from app.services.request_context import new_query_id
+from app.services.slow_query_log import slow_query_log
 
 logger = logging.getLogger(__name__)
 
+# 对比偏移单位（毫秒）
+COMPARE_UNITS = {
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+}
+
+# 流量直方图：自动选择的桶宽（毫秒）、目标桶数和最大桶数
+HISTOGRAM_STEPS = [m * 60 * 1000 for m in (1, 5, 15, 30, 60, 180, 360, 720, 1440)]
+HISTOGRAM_TARGET_BUCKETS = int(os.getenv("HISTOGRAM_TARGET_BUCKETS", "60"))
+HISTOGRAM_MAX_BUCKETS = int(os.getenv("HISTOGRAM_MAX_BUCKETS", "1000"))
+
+
+def parse_compare_offset(compare_to: str) -> int:
+    """解析对比偏移（如 1h、1d、7d、1w），返回毫秒数"""
+    match = re.fullmatch(r"\s*(\d+)\s*([mhdw])\s*", compare_to or "")
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"无效的对比偏移: {compare_to}，应为如 1h、1d、7d、1w 的格式")
+    return int(match.group(1)) * COMPARE_UNITS[match.group(2)]
+
+
+def _delta(current, previous) -> Dict[str, Any]:
+    """计算绝对变化量和变化百分比"""
+    current = current or 0
+    previous = previous or 0
+    delta = current - previous
+    return {
+        "delta": delta,
+        "delta_pct": round(delta * 100.0 / previous, 2) if previous else None
+    }
+
 class ClickHouseService:
     def __init__(self):
         self.host = os.getenv("CLICKHOUSE_HOST", "localhost")
@@ -20,133 +68,314 @@ class ClickHouseService:
         self.password = os.getenv("CLICKHOUSE_PASSWORD", "")
         self.database = os.getenv("CLICKHOUSE_DATABASE", "traffic_analysis")
         self.table = os.getenv("CLICKHOUSE_TABLE", "flow_stats")
+
+        # 会话下钻缓存及单条会话的最长跨度
+        self.flow_cache = TTLCache(
+            maxsize=int(os.getenv("FLOW_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("FLOW_CACHE_TTL", "300"))
+        )
+        registry.register_cache("flow", self.flow_cache)
+        self.flow_max_span_ms = int(os.getenv("FLOW_MAX_SPAN_MINUTES", "60")) * 60 * 1000
         
-        self.client = None
+        # 连接池大小、断线后重连的最小间隔（秒）
+        self.pool_size = int(os.getenv("CLICKHOUSE_POOL_SIZE", "8"))
+        self.reconnect_interval = float(os.getenv("CLICKHOUSE_RECONNECT_INTERVAL", "30"))
+        self._last_connect_attempt = 0.0
+
+        # 聚合查询结果缓存（按SQL文本和时间窗口内的数据水位），仪表盘轮询和启动预热共用；
+        # 窗口内数据变化时缓存键随之变化，TTL只是上限
+        self.result_cache = TTLCache(
+            maxsize=int(os.getenv("AGGREGATE_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("AGGREGATE_CACHE_TTL", "300"))
+        )
+        registry.register_cache("aggregate", self.result_cache)
+        registry.register_collector(self._pool_metrics)
+
+        # 按分区跟踪数据新鲜度
+        self.freshness = FreshnessTracker(self._query, self.database, self.table)
+        registry.register_collector(self.freshness.metrics)
+
+        # 会话列表翻页预读
+        self.page_prefetcher = PagePrefetcher()
+        registry.register_cache("page_prefetch", self.page_prefetcher)
+
+        self.pool = None
         if CLICKHOUSE_AVAILABLE:
             self._connect()
         else:
             logger.warning("ClickHouse driver not available, using mock data only")
+
+    @property
+    def available(self) -> bool:
+        """ClickHouse是否可用（不可用时返回模拟数据）"""
+        return self.pool is not None
+
+    def _new_client(self):
+        return Client(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password
+        )
     
     def _connect(self):
-        """建立ClickHouse连接"""
+        """建立ClickHouse连接池"""
         if not CLICKHOUSE_AVAILABLE:
             logger.warning("ClickHouse driver not available")
             return
 
+        self._last_connect_attempt = time.monotonic()
         try:
             logger.info(f"Attempting to connect to ClickHouse at {self.host}:{self.port}")
             logger.info(f"Database: {self.database}, Table: {self.table}")
-            self.client = Client(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password
-            )
+            pool = ClickHousePool(self._new_client, size=self.pool_size)
             # 测试连接
-            self.client.execute("SELECT 1")
+            with pool.connection() as client:
+                client.execute("SELECT 1")
+            self.pool = pool
             logger.info(f"Connected to ClickHouse at {self.host}:{self.port}")
-
-            # 测试查询
-            test_result = self.client.execute(f"SELECT COUNT(*) FROM {self.database}.{self.table}")
-            logger.info(f"Test query result: {test_result}")
         except Exception as e:
             logger.error(f"Failed to connect to ClickHouse: {e}")
-            self.client = None
-    
+            self.pool = None
+
+    def ensure_connected(self, force: bool = False) -> bool:
+        """连接不可用时按重连间隔重试，返回当前是否可用"""
+        if self.pool is None and CLICKHOUSE_AVAILABLE and (
+                force or time.monotonic() - self._last_connect_attempt >= self.reconnect_interval):
+            self._connect()
+        return self.available
+
+    def attach_client(self, client) -> None:
+        """使用外部提供的客户端（如压测用的嵌入式替身）"""
+        self.pool = ClickHousePool(lambda: client, size=1)
+        self.result_cache.clear()
+
+    def ping(self) -> bool:
+        """检查ClickHouse是否可以响应查询"""
+        if not self.available:
+            return False
+        try:
+            with self.pool.connection() as client:
+                client.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"ClickHouse ping failed: {e}")
+            return False
+
+    def warmup(self) -> Dict[str, Any]:
+        """预热：建立全部连接并预先执行仪表盘查询，填充聚合缓存"""
+        started = time.perf_counter()
+        connections = 0
+        if self.ensure_connected(force=True):
+            connections = self.pool.warm()
+            self.freshness.refresh(force=True)
+            self.get_session_stats()
+            self.get_top_ips(limit=5)
+            self.get_top_ips(limit=10)
+            self.get_protocol_stats()
+            self.get_time_range()
+        return {
+            "clickhouse": "connected" if self.available else "unavailable",
+            "connections": connections,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    def _pool_metrics(self) -> List[str]:
+        stats = self.pool.stats() if self.pool else {"size": 0, "created": 0, "in_use": 0, "idle": 0}
+        lines = [
+            "# HELP clickhouse_pool_connections ClickHouse connection pool usage",
+            "# TYPE clickhouse_pool_connections gauge",
+        ]
+        lines.extend(f'clickhouse_pool_connections{{state="{k}"}} {v}' for k, v in stats.items())
+        return lines
+
+    def _query(self, name: str, query: str, params: Optional[Dict] = None, columnar: bool = False):
+        """执行查询并记录耗时、读取行数和字节数；query_id以请求ID为前缀，可在system.query_log中关联。
+        columnar=True 时按列返回结果"""
+        query_id = new_query_id()
+        error = None
+        waited = time.perf_counter()
+        with request_thread(), self.pool.connection() as client:
+            add_phase("pool_wait", time.perf_counter() - waited)
+            clickhouse_queries_in_flight.inc()
+            start = time.perf_counter()
+            try:
+                result = client.execute(query, params, query_id=query_id, columnar=columnar)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                add_phase("clickhouse", elapsed)
+                clickhouse_queries_in_flight.dec()
+                clickhouse_query_duration.observe(elapsed, query=name)
+                clickhouse_queries.inc(query=name, status="error" if error else "ok")
+
+                rows_read = bytes_read = None
+                progress = getattr(getattr(client, "last_query", None), "progress", None)
+                if error is None and progress is not None:
+                    rows_read, bytes_read = progress.rows, progress.bytes
+                    clickhouse_rows_read.inc(rows_read, query=name)
+                    clickhouse_bytes_read.inc(bytes_read, query=name)
+                slow_query_log.observe(
+                    name, query, params, elapsed, query_id,
+                    rows_read=rows_read, bytes_read=bytes_read, error=error,
+                    explain=lambda: self._explain(client, query, params)
+                )
+
+        clickhouse_rows_returned.inc(len(result[0]) if columnar and result else len(result), query=name)
+        return result
+
+    def _cached_query(self, name: str, query: str, params: Optional[Dict] = None,
+                      window: Optional[Tuple[int, int]] = None):
+        """带结果缓存的查询（用于聚合类查询），查询失败时不缓存；
+        window 为查询涉及的时间戳区间（None表示全表），区间内数据变化后重新查询"""
+        key = (query, tuple(sorted((params or {}).items())), self.freshness.window_version(window))
+        return self.result_cache.get_or_set(key, lambda: self._query(name, query, params))
+
+    def _explain(self, client, query: str, params: Optional[Dict] = None) -> List[str]:
+        """获取查询的执行计划（含索引使用情况）"""
+        rows = client.execute(f"EXPLAIN indexes = 1 {query}", params)
+        return [row[0] for row in rows]
+
     def _execute_query(self, query: str, params: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """执行查询并返回结果"""
-        if not self.client:
+        if not self.available:
             logger.warning("ClickHouse not available, returning mock data")
             return []
 
         try:
-            result = self.client.execute(query, params or {})
+            result = self._query("adhoc", query, params)
             return result
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
             return []
     
-    def get_session_data(self,
-                        start_time: Optional[str] = None,
-                        end_time: Optional[str] = None,
-                        src_ip: Optional[str] = None,
-                        dst_ip: Optional[str] = None,
-                        protocol: Optional[str] = None,
-                        app_name: Optional[str] = None,
-                        limit: int = 20,
-                        offset: int = 0) -> Dict[str, Any]:
-        """获取会话数据"""
+    def _require_available(self, fallback: bool) -> None:
+        """不允许退化为模拟数据时，ClickHouse不可用则抛出ConnectionError"""
+        if not fallback and not self.available:
+            raise ConnectionError("ClickHouse 不可用")
 
-        where_conditions = []
-        params = {}
+    def _time_bounds(self, start_time: Optional[str], end_time: Optional[str]) -> Optional[Tuple[int, int]]:
+        """将时间字符串转换为毫秒时间戳区间；未同时指定时返回None，格式无效时抛出ValueError"""
+        if not (start_time and end_time):
+            return None
+        try:
+            start_dt = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
+            end_dt = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError(f"无效的时间格式: {start_time}, {end_time}，应为 YYYY-MM-DD HH:MM:SS")
 
-        if start_time and end_time:
-            # Convert datetime strings to Unix timestamps for comparison
-            try:
-                start_dt = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
-                end_dt = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
+        # 开始时间精确到毫秒的开始 (加000)
+        start_ts = int(start_dt.timestamp() * 1000)
+        # 结束时间精确到下一秒的开始减1毫秒 (加999)
+        end_ts = int(end_dt.timestamp() * 1000) + 999
+        return start_ts, end_ts
+
+    def _time_condition(self, start_time: Optional[str], end_time: Optional[str]) -> str:
+        """构造时间窗口的过滤条件，未指定时返回空字符串"""
+        bounds = self._time_bounds(start_time, end_time)
+        if not bounds:
+            return ""
+        return f"timestamp BETWEEN {bounds[0]} AND {bounds[1]}"
 
-                # 开始时间精确到毫秒的开始 (加000)
-                start_ts = int(start_dt.timestamp() * 1000)
-                # 结束时间精确到下一秒的开始减1毫秒 (加999)
-                end_ts = int(end_dt.timestamp() * 1000) + 999
+    def _time_where(self, start_time: Optional[str], end_time: Optional[str]) -> str:
+        """构造时间窗口的WHERE子句"""
+        condition = self._time_condition(start_time, end_time)
+        return f"WHERE {condition}" if condition else ""
 
-                where_conditions.append(f"timestamp BETWEEN {start_ts} AND {end_ts}")
-                logger.info(f"Time filter: {start_time} ({start_ts}) to {end_time} ({end_ts})")
-            except ValueError as e:
-                logger.warning(f"Invalid datetime format: {start_time}, {end_time} - {e}")
+    def _compare_span(self, start_time: Optional[str], end_time: Optional[str],
+                      compare_to: str) -> Tuple[int, int]:
+        """对比查询涉及的完整时间戳区间（对比窗口开始到当前窗口结束）"""
+        start_ts, end_ts = self._time_bounds(start_time, end_time)
+        return start_ts - parse_compare_offset(compare_to), end_ts
 
-        if src_ip:
-            where_conditions.append(f"src_ip = '{src_ip}'")
+    def _compare_windows(self, start_time: Optional[str], end_time: Optional[str],
+                         compare_to: str) -> Tuple[str, str]:
+        """返回当前窗口与对比窗口的过滤条件"""
+        bounds = self._time_bounds(start_time, end_time)
+        if not bounds:
+            raise ValueError("对比查询需要指定有效的 start_time 和 end_time")
+        offset = parse_compare_offset(compare_to)
+        start_ts, end_ts = bounds
+        current = f"timestamp BETWEEN {start_ts} AND {end_ts}"
+        previous = f"timestamp BETWEEN {start_ts - offset} AND {end_ts - offset}"
+        return current, previous
 
-        if dst_ip:
-            where_conditions.append(f"dst_ip = '{dst_ip}'")
+    def _session_where(self,
+                       start_time: Optional[str],
+                       end_time: Optional[str],
+                       src_ip: Optional[str],
+                       dst_ip: Optional[str],
+                       protocol: Optional[str],
+                       app_name: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """构造会话明细查询的WHERE子句，返回 (子句, 查询参数)；过滤值通过参数传入，不拼接到SQL中"""
+        where_conditions = []
+        params: Dict[str, Any] = {}
 
-        if protocol:
-            where_conditions.append(f"protocol_name = '{protocol}'")
+        bounds = self._time_bounds(start_time, end_time)
+        if bounds:
+            start_ts, end_ts = bounds
+            where_conditions.append(f"timestamp BETWEEN {start_ts} AND {end_ts}")
+            logger.debug(f"Time filter: {start_time} ({start_ts}) to {end_time} ({end_ts})")
 
-        if app_name:
-            where_conditions.append(f"app_name = '{app_name}'")
+        for column, name, value in (("src_ip", "src_ip", src_ip), ("dst_ip", "dst_ip", dst_ip),
+                                    ("protocol_name", "protocol", protocol), ("app_name", "app_name", app_name)):
+            if value:
+                where_conditions.append(f"{column} = %({name})s")
+                params[name] = value
 
         where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        return where_clause, params
 
-        # 查询数据
-        data_query = f"""
+    def _session_block(self, name: str, where_clause: str, params: Dict[str, Any],
+                       limit: int, offset: int = 0) -> SessionBlock:
+        """按时间倒序查询会话明细，以列式紧凑格式返回"""
+        # 过滤条件在子查询中执行，避免IP列被同名的整数别名覆盖
+        query = f"""
         SELECT
-            toDateTime(timestamp/1000) as timestamp,
-            src_ip,
-            dst_ip,
-            src_port,
-            dst_port,
-            protocol,
-            total_packets,
-            total_bytes,
-            up_packets,
-            up_bytes,
-            down_packets,
-            down_bytes,
-            duration,
-            avg_pps,
-            avg_bps,
-            min_packet_size,
-            max_packet_size,
-            avg_packet_size,
-            protocol_name,
-            protocol_confidence,
-            app_name,
-            app_confidence,
-            matched_domain,
-            toDateTime(first_seen/1000) as first_seen,
-            toDateTime(last_seen/1000) as last_seen,
-            toString(tcp_flags) as tcp_flags,
-            retransmissions,
-            out_of_order,
-            lost_packets
-        FROM {self.database}.{self.table}
-        {where_clause}
+            {COMPACT_SELECT}
+        FROM (
+            SELECT *
+            FROM {self.database}.{self.table}
+            {where_clause}
+            ORDER BY timestamp DESC
+            LIMIT {int(limit)} OFFSET {int(offset)}
+        )
         ORDER BY timestamp DESC
-        LIMIT {limit} OFFSET {offset}
         """
+        logger.debug(f"Executing data query: {query}")
+        columns = self._query(name, query, params, columnar=True)
+        with phase("conversion"):
+            return SessionBlock.from_columns(columns)
+
+    def get_session_data(self,
+                        start_time: Optional[str] = None,
+                        end_time: Optional[str] = None,
+                        src_ip: Optional[str] = None,
+                        dst_ip: Optional[str] = None,
+                        protocol: Optional[str] = None,
+                        app_name: Optional[str] = None,
+                        limit: int = 20,
+                        offset: int = 0,
+                        user: Optional[str] = None) -> Dict[str, Any]:
+        """获取会话数据；指定user时启用翻页预读"""
+        with phase("query_build"):
+            where_clause, params = self._session_where(start_time, end_time, src_ip, dst_ip, protocol, app_name)
+
+        # 翻页预读：命中时直接返回，否则在同一查询中多取后续几页
+        prefetch_key = (start_time, end_time, src_ip, dst_ip, protocol, app_name)
+        bounds = self._time_bounds(start_time, end_time)
+        version = self.freshness.window_version(bounds) if (user and self.available) else None
+        fetch_limit = limit
+        known_total = None
+        if version is not None:
+            page = self.page_prefetcher.get_page(user, prefetch_key, version, offset, limit)
+            if page is not None:
+                with phase("conversion"):
+                    return {"data": page["data"].to_dicts(), "total": page["total"]}
+            fetch_limit = self.page_prefetcher.fetch_size(user, prefetch_key, limit)
+            known_total = self.page_prefetcher.known_total(user, prefetch_key, version)
 
         # 查询总数
         count_query = f"""
@@ -156,48 +385,53 @@ class ClickHouseService:
         """
 
         try:
-            if self.client:
-                logger.info(f"Executing data query: {data_query}")
-                logger.info(f"Executing count query: {count_query}")
-                data_result = self.client.execute(data_query)
-                count_result = self.client.execute(count_query)
-
-                # 构造返回数据
-                columns = [
-                    'timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol',
-                    'total_packets', 'total_bytes', 'up_packets', 'up_bytes', 'down_packets', 'down_bytes',
-                    'duration', 'avg_pps', 'avg_bps', 'min_packet_size', 'max_packet_size', 'avg_packet_size',
-                    'protocol_name', 'protocol_confidence', 'app_name', 'app_confidence', 'matched_domain',
-                    'first_seen', 'last_seen', 'tcp_flags', 'retransmissions', 'out_of_order', 'lost_packets'
-                ]
+            if self.available:
+                block = self._session_block("session_data", where_clause, params, fetch_limit, offset)
+                if known_total is not None:
+                    total = known_total
+                else:
+                    logger.debug(f"Executing count query: {count_query}")
+                    count_result = self._query("session_count", count_query, params)
+                    total = count_result[0][0] if count_result else 0
+                logger.debug(f"Query returned {len(block)} records, total: {total}")
 
-                data = []
-                for row in data_result:
-                    row_dict = dict(zip(columns, row))
-                    # Convert datetime objects to strings
-                    if isinstance(row_dict['timestamp'], datetime):
-                        row_dict['timestamp'] = row_dict['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-                    if isinstance(row_dict['first_seen'], datetime):
-                        row_dict['first_seen'] = row_dict['first_seen'].strftime('%Y-%m-%d %H:%M:%S')
-                    if isinstance(row_dict['last_seen'], datetime):
-                        row_dict['last_seen'] = row_dict['last_seen'].strftime('%Y-%m-%d %H:%M:%S')
-                    # Convert tcp_flags to string
-                    row_dict['tcp_flags'] = str(row_dict['tcp_flags'])
-                    data.append(row_dict)
-
-                total = count_result[0][0] if count_result else 0
-                logger.info(f"Query returned {len(data)} records, total: {total}")
-
-                return {"data": data, "total": total}
+                if version is not None:
+                    self.page_prefetcher.store(user, prefetch_key, version, offset, block, total)
+                # 只在输出时转换为显示格式
+                with phase("conversion"):
+                    return {"data": block[:limit].to_dicts(), "total": total}
             else:
                 return self._get_mock_session_data(limit)
 
         except Exception as e:
             logger.error(f"Failed to get session data: {e}")
             return self._get_mock_session_data(limit)
-    
-    def get_session_stats(self) -> Dict[str, Any]:
-        """获取会话统计数据"""
+
+    def export_sessions(self,
+                        start_time: Optional[str] = None,
+                        end_time: Optional[str] = None,
+                        src_ip: Optional[str] = None,
+                        dst_ip: Optional[str] = None,
+                        protocol: Optional[str] = None,
+                        app_name: Optional[str] = None,
+                        limit: int = 10000,
+                        fallback: bool = True) -> SessionBlock:
+        """导出会话数据（列式紧凑格式，不查询总数）；fallback=False 时ClickHouse不可用直接抛出异常"""
+        with phase("query_build"):
+            where_clause, params = self._session_where(start_time, end_time, src_ip, dst_ip, protocol, app_name)
+        self._require_available(fallback)
+        if not self.available:
+            return SessionBlock.from_dicts(self._get_mock_session_data(min(limit, 100))["data"])
+        try:
+            return self._session_block("session_export", where_clause, params, limit)
+        except Exception as e:
+            logger.error(f"Failed to export session data: {e}")
+            raise
+
+    def get_session_stats(self, start_time: Optional[str] = None,
+                          end_time: Optional[str] = None, fallback: bool = True) -> Dict[str, Any]:
+        """获取会话统计数据；fallback=False 时ClickHouse不可用或查询失败直接抛出异常，不返回模拟数据"""
+        self._require_available(fallback)
         query = f"""
         SELECT
             count(*) as total_sessions,
@@ -207,11 +441,12 @@ class ClickHouseService:
             uniq(src_ip) as unique_ips,
             max(timestamp) as last_activity
         FROM {self.database}.{self.table}
+        {self._time_where(start_time, end_time)}
         """
 
         try:
-            if self.client:
-                result = self.client.execute(query)
+            if self.available:
+                result = self._cached_query("session_stats", query, window=self._time_bounds(start_time, end_time))
                 if result:
                     row = result[0]
                     return {
@@ -226,59 +461,71 @@ class ClickHouseService:
             return self._get_mock_stats()
         except Exception as e:
             logger.error(f"Failed to get stats: {e}")
+            if not fallback:
+                raise
             return self._get_mock_stats()
     
-    def get_top_ips(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取热门IP统计"""
+    def get_top_ips(self, limit: int = 10, start_time: Optional[str] = None,
+                    end_time: Optional[str] = None, fallback: bool = True) -> List[Dict[str, Any]]:
+        """获取热门IP统计；fallback 含义同 get_session_stats"""
+        self._require_available(fallback)
         query = f"""
         SELECT
-            src_ip as ip,
+            {ip_num_sql("src_ip")} as ip,
             count(*) as sessions,
             sum(total_bytes) as traffic_bytes
         FROM {self.database}.{self.table}
-        GROUP BY src_ip
+        {self._time_where(start_time, end_time)}
+        GROUP BY ip
         ORDER BY sessions DESC
         LIMIT {limit}
         """
 
         try:
-            if self.client:
-                logger.info(f"Executing top IPs query: {query}")
-                result = self.client.execute(query)
+            if self.available:
+                logger.debug(f"Executing top IPs query: {query}")
+                result = self._cached_query("top_ips", query, window=self._time_bounds(start_time, end_time))
                 data = [
                     {
-                        "ip": row[0],
+                        "ip": format_ip(row[0]),
                         "sessions": row[1],
                         "traffic_bytes": row[2] or 0,
                         "risk": "low"  # 默认风险等级
                     }
                     for row in result
                 ]
-                logger.info(f"Top IPs query returned {len(data)} records")
+                logger.debug(f"Top IPs query returned {len(data)} records")
                 return data
 
             return self._get_mock_top_ips(limit)
         except Exception as e:
             logger.error(f"Failed to get top IPs: {e}")
+            if not fallback:
+                raise
             return self._get_mock_top_ips(limit)
     
-    def get_protocol_stats(self) -> List[Dict[str, Any]]:
-        """获取协议统计"""
+    def get_protocol_stats(self, start_time: Optional[str] = None,
+                           end_time: Optional[str] = None, fallback: bool = True) -> List[Dict[str, Any]]:
+        """获取协议统计；fallback 含义同 get_session_stats"""
+        self._require_available(fallback)
+        time_condition = self._time_condition(start_time, end_time)
+        time_where = f"WHERE {time_condition}" if time_condition else ""
+        time_and = f"AND {time_condition}" if time_condition else ""
         query = f"""
         SELECT
             protocol_name as name,
             count(*) as count,
-            round((count(*) * 100.0) / (SELECT count(*) FROM {self.database}.{self.table}), 2) as percentage
+            round((count(*) * 100.0) / (SELECT count(*) FROM {self.database}.{self.table} {time_where}), 2) as percentage
         FROM {self.database}.{self.table}
-        WHERE protocol_name != ''
+        WHERE protocol_name != '' {time_and}
         GROUP BY protocol_name
         ORDER BY count DESC
         LIMIT 10
         """
         
         try:
-            if self.client:
-                result = self.client.execute(query)
+            if self.available:
+                result = self._cached_query("protocol_stats", query, window=self._time_bounds(start_time, end_time))
                 return [
                     {
                         "name": row[0],
@@ -291,45 +538,480 @@ class ClickHouseService:
             return self._get_mock_protocol_stats()
         except Exception as e:
             logger.error(f"Failed to get protocol stats: {e}")
+            if not fallback:
+                raise
             return self._get_mock_protocol_stats()
     
-    def get_time_range(self) -> Dict[str, Any]:
-        """获取数据的时间范围"""
+    def get_traffic_histogram(self,
+                              start_time: Optional[str] = None,
+                              end_time: Optional[str] = None,
+                              src_ip: Optional[str] = None,
+                              dst_ip: Optional[str] = None,
+                              protocol: Optional[str] = None,
+                              app_name: Optional[str] = None,
+                              interval: Optional[str] = None) -> Dict[str, Any]:
+        """按时间分桶统计会话数、字节数和包数；未指定桶宽（如 5m、1h）时按时间跨度自动选择"""
+        bounds = self._time_bounds(start_time, end_time)
+        span = bounds or (self.freshness.time_range() if self.available else None)
+        if span is None and self.available:
+            # 水位探测失败时无法由分区得到时间跨度，直接查询（只读取timestamp列）
+            span = self._query("histogram_span",
+                               f"SELECT min(timestamp), max(timestamp) FROM {self.database}.{self.table}")[0]
+        span_ms = span[1] - span[0] if span and span[0] is not None else 0
+
+        if interval:
+            step = parse_compare_offset(interval)
+            if span_ms // step > HISTOGRAM_MAX_BUCKETS:
+                raise ValueError(f"桶宽 {interval} 过小，时间范围内超过 {HISTOGRAM_MAX_BUCKETS} 个桶")
+        else:
+            target = span_ms / HISTOGRAM_TARGET_BUCKETS
+            step = next((s for s in HISTOGRAM_STEPS if s >= target), HISTOGRAM_STEPS[-1])
+            while span_ms // step > HISTOGRAM_MAX_BUCKETS:
+                step *= 2
+
+        if not self.available:
+            return self._get_mock_histogram(step)
+
+        where_clause, params = self._session_where(start_time, end_time, src_ip, dst_ip, protocol, app_name)
         query = f"""
         SELECT
-            min(timestamp) as min_ts,
-            max(timestamp) as max_ts,
-            toDateTime(min(timestamp/1000)) as min_time,
-            toDateTime(max(timestamp/1000)) as max_time
+            intDiv(timestamp, {step}) * {step} as bucket,
+            count() as sessions,
+            sum(total_bytes) as bytes,
+            sum(total_packets) as packets
         FROM {self.database}.{self.table}
+        {where_clause}
+        GROUP BY bucket
+        ORDER BY bucket
+        LIMIT {HISTOGRAM_MAX_BUCKETS}
         """
 
         try:
-            if self.client:
-                result = self.client.execute(query)
-                if result:
-                    row = result[0]
-                    return {
-                        "min_timestamp": row[0],
-                        "max_timestamp": row[1],
-                        "min_time": str(row[2]) if row[2] else None,
-                        "max_time": str(row[3]) if row[3] else None
-                    }
+            rows = self._cached_query("traffic_histogram", query, params, window=bounds)
+        except Exception as e:
+            logger.error(f"Failed to get traffic histogram: {e}")
+            raise
+        return {
+            "interval_ms": step,
+            "buckets": [
+                {"time": format_ms(bucket), "sessions": sessions, "bytes": n_bytes, "packets": packets}
+                for bucket, sessions, n_bytes, packets in rows
+            ]
+        }
+
+    def compare_session_stats(self, start_time: Optional[str], end_time: Optional[str],
+                              compare_to: str) -> Dict[str, Any]:
+        """环比统计：单次扫描同时计算当前窗口与对比窗口；查询失败时抛出异常"""
+        current, previous = self._compare_windows(start_time, end_time, compare_to)
+        # 别名不能与源列同名，否则后面的 sumIf(total_packets, ...) 会引用聚合结果而报错
+        query = f"""
+        SELECT
+            countIf({current}) as cur_total_sessions,
+            sumIf(total_packets, {current}) as cur_total_packets,
+            sumIf(total_bytes, {current}) as cur_total_bytes,
+            uniqIf(src_ip, {current}) as cur_unique_ips,
+            countIf({previous}) as prev_total_sessions,
+            sumIf(total_packets, {previous}) as prev_total_packets,
+            sumIf(total_bytes, {previous}) as prev_total_bytes,
+            uniqIf(src_ip, {previous}) as prev_unique_ips
+        FROM {self.database}.{self.table}
+        WHERE ({current}) OR ({previous})
+        """
+        fields = ["total_sessions", "total_packets", "total_traffic", "unique_ips"]
+
+        try:
+            if self.available:
+                result = self._cached_query(
+                    "compare_stats", query, window=self._compare_span(start_time, end_time, compare_to))
+                row = result[0] if result else [0] * 8
+                current_values = {name: row[i] or 0 for i, name in enumerate(fields)}
+                previous_values = {name: row[i + 4] or 0 for i, name in enumerate(fields)}
+            else:
+                mock = self._get_mock_stats()
+                current_values = {name: mock[name] for name in fields}
+                previous_values = dict(current_values)
+        except Exception as e:
+            logger.error(f"Failed to compare stats: {e}")
+            raise
+
+        deltas = {name: _delta(current_values[name], previous_values[name]) for name in fields}
+        return {
+            "compare_to": compare_to,
+            "current": current_values,
+            "previous": previous_values,
+            "delta": {name: d["delta"] for name, d in deltas.items()},
+            "delta_pct": {name: d["delta_pct"] for name, d in deltas.items()}
+        }
+
+    def compare_top_ips(self, start_time: Optional[str], end_time: Optional[str],
+                        compare_to: str, limit: int = 10) -> Dict[str, Any]:
+        """热门IP环比：单次扫描返回当前排名与变化最大的IP；查询失败时抛出异常"""
+        current, previous = self._compare_windows(start_time, end_time, compare_to)
+        query = f"""
+        SELECT ip, sessions, prev_sessions, traffic_bytes, prev_traffic_bytes, cur_rank, mover_rank
+        FROM (
+            SELECT
+                ip, sessions, prev_sessions, traffic_bytes, prev_traffic_bytes,
+                row_number() OVER (ORDER BY sessions DESC, ip) as cur_rank,
+                row_number() OVER (ORDER BY abs(toInt64(sessions) - toInt64(prev_sessions)) DESC, ip) as mover_rank
+            FROM (
+                SELECT
+                    {ip_num_sql("src_ip")} as ip,
+                    countIf({current}) as sessions,
+                    countIf({previous}) as prev_sessions,
+                    sumIf(total_bytes, {current}) as traffic_bytes,
+                    sumIf(total_bytes, {previous}) as prev_traffic_bytes
+                FROM {self.database}.{self.table}
+                WHERE ({current}) OR ({previous})
+                GROUP BY ip
+            )
+        )
+        WHERE cur_rank <= {limit} OR mover_rank <= {limit}
+        """
 
-            return {
-                "min_timestamp": None,
-                "max_timestamp": None,
-                "min_time": None,
-                "max_time": None
+        try:
+            if self.available:
+                rows = self._cached_query(
+                    "compare_top_ips", query, window=self._compare_span(start_time, end_time, compare_to))
+            else:
+                rows = [
+                    (ip["ip"], ip["sessions"], ip["sessions"], ip["traffic_bytes"], ip["traffic_bytes"], i + 1, i + 1)
+                    for i, ip in enumerate(self._get_mock_top_ips(limit))
+                ]
+        except Exception as e:
+            logger.error(f"Failed to compare top IPs: {e}")
+            raise
+
+        items = []
+        for row in rows:
+            item = {
+                "ip": format_ip(row[0]),
+                "session_count": row[1],
+                "previous_session_count": row[2],
+                "session_delta": row[1] - row[2],
+                "total_bytes": row[3] or 0,
+                "previous_total_bytes": row[4] or 0,
+                "bytes_delta": (row[3] or 0) - (row[4] or 0)
             }
+            items.append((row[5], row[6], item))
+
+        return {
+            "compare_to": compare_to,
+            "current": [item for cur_rank, _, item in sorted(items, key=lambda x: x[0])
+                        if cur_rank <= limit and item["session_count"] > 0],
+            "movers": [item for _, mover_rank, item in sorted(items, key=lambda x: x[1])
+                       if mover_rank <= limit and item["session_delta"] != 0]
+        }
+
+    def compare_protocol_stats(self, start_time: Optional[str], end_time: Optional[str],
+                               compare_to: str, limit: int = 10) -> Dict[str, Any]:
+        """协议环比：协议基数较小，单次扫描分组后在内存中计算占比与变化；查询失败时抛出异常"""
+        current, previous = self._compare_windows(start_time, end_time, compare_to)
+        query = f"""
+        SELECT
+            protocol_name as name,
+            countIf({current}) as count,
+            countIf({previous}) as prev_count
+        FROM {self.database}.{self.table}
+        WHERE ({current}) OR ({previous})
+        GROUP BY protocol_name
+        """
+
+        try:
+            if self.available:
+                rows = self._cached_query(
+                    "compare_protocols", query, window=self._compare_span(start_time, end_time, compare_to))
+            else:
+                rows = [(p["name"], p["count"], p["count"]) for p in self._get_mock_protocol_stats()]
         except Exception as e:
-            logger.error(f"Failed to get time range: {e}")
-            return {
-                "min_timestamp": None,
-                "max_timestamp": None,
-                "min_time": None,
-                "max_time": None
+            logger.error(f"Failed to compare protocol stats: {e}")
+            raise
+
+        # 占比分母包含未识别协议，与 get_protocol_stats 保持一致
+        total = sum(row[1] for row in rows)
+        prev_total = sum(row[2] for row in rows)
+        items = [
+            {
+                "name": row[0],
+                "count": row[1],
+                "percentage": round(row[1] * 100.0 / total, 2) if total else 0.0,
+                "previous_count": row[2],
+                "previous_percentage": round(row[2] * 100.0 / prev_total, 2) if prev_total else 0.0,
+                "count_delta": row[1] - row[2]
             }
+            for row in rows if row[0] != ''
+        ]
+
+        return {
+            "compare_to": compare_to,
+            "current": sorted((i for i in items if i["count"] > 0),
+                              key=lambda i: i["count"], reverse=True)[:limit],
+            "movers": sorted((i for i in items if i["count_delta"] != 0),
+                             key=lambda i: abs(i["count_delta"]), reverse=True)[:limit]
+        }
+
+    def get_flow_detail(self,
+                        src_ip: str,
+                        dst_ip: str,
+                        src_port: int,
+                        dst_port: int,
+                        protocol: int,
+                        first_seen: str,
+                        window_minutes: int = 5,
+                        related_limit: int = 20) -> Optional[Dict[str, Any]]:
+        """按五元组和首包时间获取单条会话及其关联会话"""
+        try:
+            first_seen_dt = datetime.strptime(first_seen, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError(f"无效的first_seen格式: {first_seen}，应为 YYYY-MM-DD HH:MM:SS")
+
+        if not self.available:
+            return self._get_mock_flow_detail(src_ip, dst_ip, src_port, dst_port, protocol,
+                                              first_seen, window_minutes)
+
+        fs_start = int(first_seen_dt.timestamp() * 1000)
+        fs_end = fs_start + 999
+        window_ms = window_minutes * 60 * 1000
+
+        # 下钻涉及的时间范围内数据不变时直接使用缓存
+        span = (fs_start - window_ms, fs_end + max(window_ms, self.flow_max_span_ms))
+        cache_key = (src_ip, dst_ip, src_port, dst_port, protocol, first_seen, window_minutes, related_limit,
+                     self.freshness.window_version(span))
+        cached = self.flow_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        params = {"src_ip": src_ip, "dst_ip": dst_ip}
+        flow_condition = (
+            f"src_ip = %(src_ip)s AND dst_ip = %(dst_ip)s "
+            f"AND src_port = {int(src_port)} AND dst_port = {int(dst_port)} AND protocol = {int(protocol)} "
+            f"AND first_seen BETWEEN {fs_start} AND {fs_end}"
+        )
+
+        # 点查：会话记录时间不早于首包时间，按主键时间范围限定扫描
+        flow_query = f"""
+        SELECT
+            {COMPACT_SELECT}
+        FROM (
+            SELECT *
+            FROM {self.database}.{self.table}
+            WHERE timestamp BETWEEN {fs_start} AND {fs_end + self.flow_max_span_ms}
+              AND {flow_condition}
+            ORDER BY timestamp DESC
+            LIMIT 1
+        )
+        """
+
+        try:
+            flow = SessionBlock.from_columns(self._query("flow", flow_query, params, columnar=True)).first()
+            if flow is None:
+                return None
+
+            # 关联会话：同一主机对（双向）或同一匹配域名，限定在首包时间前后N分钟
+            same_pair = (
+                "((src_ip = %(src_ip)s AND dst_ip = %(dst_ip)s) "
+                "OR (src_ip = %(dst_ip)s AND dst_ip = %(src_ip)s))"
+            )
+            related_condition = same_pair
+            if flow["matched_domain"]:
+                params["matched_domain"] = flow["matched_domain"]
+                related_condition = f"({same_pair} OR matched_domain = %(matched_domain)s)"
+
+            related_query = f"""
+            SELECT
+                {COMPACT_SELECT},
+                same_pair
+            FROM (
+                SELECT *, {same_pair} as same_pair
+                FROM {self.database}.{self.table}
+                WHERE timestamp BETWEEN {fs_start - window_ms} AND {fs_end + window_ms}
+                  AND {related_condition}
+                  AND NOT ({flow_condition})
+                ORDER BY same_pair DESC, abs(toInt64(timestamp) - {fs_start}) ASC
+                LIMIT {int(related_limit)} BY same_pair
+            )
+            """
+            related_columns = self._query("flow_related", related_query, params, columnar=True)
+        except Exception as e:
+            logger.error(f"Failed to get flow detail: {e}")
+            raise
+
+        related_host_pair = []
+        related_domain = []
+        if related_columns:
+            related = SessionBlock.from_columns(related_columns[:-1])
+            for session, same in zip(related.iter_rows(), related_columns[-1]):
+                (related_host_pair if same else related_domain).append(session)
+
+        result = {
+            "flow": flow,
+            "related_host_pair": sorted(related_host_pair, key=lambda r: r["timestamp"]),
+            "related_domain": sorted(related_domain, key=lambda r: r["timestamp"]),
+            "window_minutes": window_minutes
+        }
+        self.flow_cache.set(cache_key, result)
+        return result
+
+    def get_time_range(self) -> Dict[str, Any]:
+        """获取数据的时间范围（由分区水位得到，不扫描表）"""
+        empty = {
+            "min_timestamp": None,
+            "max_timestamp": None,
+            "min_time": None,
+            "max_time": None
+        }
+        if not self.available:
+            return empty
+
+        bounds = self.freshness.time_range()
+        if bounds is None:
+            # 水位探测失败时退回到全表查询
+            query = f"""
+            SELECT min(timestamp), max(timestamp)
+            FROM {self.database}.{self.table}
+            """
+            try:
+                bounds = self._cached_query("time_range", query)[0]
+            except Exception as e:
+                logger.error(f"Failed to get time range: {e}")
+                return empty
+
+        min_ts, max_ts = bounds
+        if not max_ts:
+            return empty
+        return {
+            "min_timestamp": min_ts,
+            "max_timestamp": max_ts,
+            "min_time": datetime.fromtimestamp(min_ts // 1000).strftime('%Y-%m-%d %H:%M:%S'),
+            "max_time": datetime.fromtimestamp(max_ts // 1000).strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    def data_watermark(self, start_time: Optional[str] = None, end_time: Optional[str] = None) -> Optional[str]:
+        """数据水位标识（用于ETag）：指定时间窗口时只反映窗口内的数据变化；不可用时返回None"""
+        if not self.available:
+            return None
+        bounds = self._time_bounds(start_time, end_time)
+        if bounds is None:
+            return self.freshness.watermark()
+        version = self.freshness.window_version(bounds)
+        if version is None:
+            return None
+        return hashlib.sha1(repr(version).encode()).hexdigest()[:16]
+
+    def get_host_graph(self,
+                       start_time: Optional[str] = None,
+                       end_time: Optional[str] = None,
+                       src_ip: Optional[str] = None,
+                       dst_ip: Optional[str] = None,
+                       protocol: Optional[str] = None,
+                       app_name: Optional[str] = None,
+                       max_edges: int = 300,
+                       max_degree: int = 25,
+                       weight: str = "bytes",
+                       subnet_v4: Optional[int] = None,
+                       subnet_v6: Optional[int] = None,
+                       top_ports: int = 5) -> Dict[str, Any]:
+        """主机通信图：在ClickHouse中按(源,目的)聚合边，按权重取前N条并限制每个节点的度，可按子网合并节点"""
+        if weight not in ("bytes", "sessions"):
+            raise ValueError(f"无效的权重: {weight}，应为 bytes 或 sessions")
+        if not self.available:
+            return self._get_mock_graph()
+
+        where_clause, params = self._session_where(start_time, end_time, src_ip, dst_ip, protocol, app_name)
+        full = (1 << 128) - 1
+        v4_prefix = subnet_v4 if subnet_v4 is not None else 32
+        v6_prefix = subnet_v6 if subnet_v6 is not None else 128
+        # IP已打包为128位整数，IPv4映射地址的高96位固定，掩码作用在低32位
+        v4_mask = full ^ ((1 << (32 - v4_prefix)) - 1)
+        v6_mask = full ^ ((1 << (128 - v6_prefix)) - 1)
+
+        def node_sql(column: str) -> str:
+            ip = ip_num_sql(column)
+            if subnet_v4 is None and subnet_v6 is None:
+                return ip
+            return (f"if(bitShiftRight({ip}, 32) = 65535, "
+                    f"bitAnd({ip}, toUInt128('{v4_mask}')), bitAnd({ip}, toUInt128('{v6_mask}')))")
+
+        query = f"""
+        SELECT src, dst, sessions, bytes, packets, ports, port_count, first_ts, last_ts, total_edges
+        FROM (
+            SELECT
+                *,
+                row_number() OVER (PARTITION BY src ORDER BY {weight} DESC) as src_rank,
+                row_number() OVER (PARTITION BY dst ORDER BY {weight} DESC) as dst_rank,
+                count() OVER () as total_edges
+            FROM (
+                SELECT
+                    {node_sql("src_ip")} as src,
+                    {node_sql("dst_ip")} as dst,
+                    count() as sessions,
+                    sum(total_bytes) as bytes,
+                    sum(total_packets) as packets,
+                    topK({int(top_ports)})(dst_port) as ports,
+                    uniq(dst_port) as port_count,
+                    min(timestamp) as first_ts,
+                    max(timestamp) as last_ts
+                FROM (
+                    SELECT *
+                    FROM {self.database}.{self.table}
+                    {where_clause}
+                )
+                GROUP BY src, dst
+            )
+        )
+        WHERE src_rank <= {int(max_degree)} AND dst_rank <= {int(max_degree)}
+        ORDER BY {weight} DESC
+        LIMIT {int(max_edges)}
+        """
+
+        try:
+            rows = self._cached_query("host_graph", query, params, window=self._time_bounds(start_time, end_time))
+        except Exception as e:
+            logger.error(f"Failed to get host graph: {e}")
+            raise
+
+        def label(value: int, ipv4: bool) -> str:
+            text = format_ip(value)
+            if ipv4 and subnet_v4 is not None:
+                return f"{text}/{v4_prefix}"
+            if not ipv4 and subnet_v6 is not None:
+                return f"{text}/{v6_prefix}"
+            return text
+
+        nodes: Dict[str, Dict[str, Any]] = {}
+        edges = []
+        for src, dst, sessions, n_bytes, packets, ports, port_count, first_ts, last_ts, _ in rows:
+            source = label(src, src >> 32 == 0xFFFF)
+            target = label(dst, dst >> 32 == 0xFFFF)
+            edges.append({
+                "source": source,
+                "target": target,
+                "sessions": sessions,
+                "bytes": n_bytes,
+                "packets": packets,
+                "ports": list(ports),
+                "port_count": port_count,
+                "first_seen": format_ms(first_ts),
+                "last_seen": format_ms(last_ts)
+            })
+            for node_id, direction in ((source, "out"), (target, "in")):
+                node = nodes.get(node_id)
+                if node is None:
+                    node = nodes[node_id] = {"id": node_id, "sessions": 0, "bytes_out": 0, "bytes_in": 0,
+                                             "degree_out": 0, "degree_in": 0}
+                node["sessions"] += sessions
+                node[f"bytes_{direction}"] += n_bytes
+                node[f"degree_{direction}"] += 1
+
+        total_edges = rows[0][-1] if rows else 0
+        return {
+            "nodes": sorted(nodes.values(), key=lambda n: n["bytes_out"] + n["bytes_in"], reverse=True),
+            "edges": edges,
+            "total_edges": total_edges,
+            "truncated": total_edges > len(edges),
+            "weight": weight,
+            "subnet_v4": subnet_v4,
+            "subnet_v6": subnet_v6
+        }
 
     def _get_mock_session_data(self, limit: int) -> Dict[str, Any]:
         """模拟会话数据"""
@@ -375,6 +1057,19 @@ class ClickHouseService:
         
         return {"data": data, "total": 1000}
     
+    def _get_mock_flow_detail(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int,
+                              protocol: int, first_seen: str, window_minutes: int) -> Dict[str, Any]:
+        """模拟会话下钻数据"""
+        sessions = self._get_mock_session_data(3)["data"]
+        flow = dict(sessions[0], src_ip=src_ip, dst_ip=dst_ip, src_port=src_port,
+                    dst_port=dst_port, protocol=protocol, first_seen=first_seen)
+        return {
+            "flow": flow,
+            "related_host_pair": [],
+            "related_domain": sessions[1:],
+            "window_minutes": window_minutes
+        }
+
     def _get_mock_stats(self) -> Dict[str, Any]:
         """模拟统计数据"""
         return {
@@ -402,6 +1097,34 @@ class ClickHouseService:
             {"name": "DNS", "count": 15678, "percentage": 15.0}
         ]
 
+    def _get_mock_histogram(self, step: int) -> Dict[str, Any]:
+        """模拟流量直方图"""
+        start = int(datetime(2024, 1, 15, 14, 0).timestamp() * 1000) // step * step
+        return {
+            "interval_ms": step,
+            "buckets": [
+                {"time": format_ms(start + i * step), "sessions": 1200 + 150 * (i % 4),
+                 "bytes": 8388608 + 524288 * (i % 3), "packets": 9600 + 800 * (i % 5)}
+                for i in range(12)
+            ]
+        }
+
+    def _get_mock_graph(self) -> Dict[str, Any]:
+        """模拟主机通信图"""
+        edges = [
+            {"source": "192.168.1.100", "target": "8.8.8.8", "sessions": 120, "bytes": 184320, "packets": 2880,
+             "ports": [53], "port_count": 1, "first_seen": "2024-01-15 14:00:00", "last_seen": "2024-01-15 14:59:00"},
+            {"source": "192.168.1.100", "target": "192.85.1.22", "sessions": 45, "bytes": 9437184, "packets": 7200,
+             "ports": [443], "port_count": 1, "first_seen": "2024-01-15 14:05:00", "last_seen": "2024-01-15 14:55:00"},
+        ]
+        nodes = [
+            {"id": "192.168.1.100", "sessions": 165, "bytes_out": 9621504, "bytes_in": 0, "degree_out": 2, "degree_in": 0},
+            {"id": "192.85.1.22", "sessions": 45, "bytes_out": 0, "bytes_in": 9437184, "degree_out": 0, "degree_in": 1},
+            {"id": "8.8.8.8", "sessions": 120, "bytes_out": 0, "bytes_in": 184320, "degree_out": 0, "degree_in": 1},
+        ]
+        return {"nodes": nodes, "edges": edges, "total_edges": len(edges), "truncated": False,
+                "weight": "bytes", "subnet_v4": None, "subnet_v6": None}
+
 # 全局实例
 clickhouse_service = None
 
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 探测 system.parts 的最小间隔（秒）
+FRESHNESS_INTERVAL = float(os.getenv("FRESHNESS_INTERVAL", "5"))
+
+
+class PartitionMark(NamedTuple):
+    """单个分区的水位：最后修改时间、行数、分片数及时间戳范围（毫秒）"""
+    modified: object
+    rows: int
+    parts: int
+    min_ts: int
+    max_ts: int
+
+
+class FreshnessTracker:
+    """数据新鲜度跟踪：按分区记录水位，判断某个时间窗口内的数据自上次以来是否变化
+
+    只读取 system.parts（元数据）；分区新增或变化时才对该分区查询时间戳范围，
+    通常只有最新的分区会变化，探测代价与表大小无关。
+    """
+
+    def __init__(self, query: Callable, database: str, table: str, interval: float = FRESHNESS_INTERVAL):
+        self._query = query
+        self.database = database
+        self.table = table
+        self.interval = interval
+        self.partitions: Dict[str, PartitionMark] = {}
+        self.version = 0
+        self.ok = False
+        self._last_probe = 0.0
+        self._probe_lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> None:
+        """距上次探测超过间隔时重新探测；并发调用时只有一个线程探测，其余使用当前水位"""
+        if not force and time.monotonic() - self._last_probe < self.interval:
+            return
+        if not self._probe_lock.acquire(blocking=force or not self.ok):
+            return
+        try:
+            if force or time.monotonic() - self._last_probe >= self.interval:
+                self._probe()
+        finally:
+            self._probe_lock.release()
+
+    def _probe(self) -> None:
+        self._last_probe = time.monotonic()
+        params = {"database": self.database, "table": self.table}
+        try:
+            rows = self._query("freshness_parts", """
+            SELECT partition_id, max(modification_time), sum(rows), count()
+            FROM system.parts
+            WHERE database = %(database)s AND table = %(table)s AND active
+            GROUP BY partition_id
+            """, params)
+
+            current = self.partitions
+            changed = [pid for pid, modified, n_rows, parts in rows
+                       if pid not in current or current[pid][:3] != (modified, n_rows, parts)]
+            ranges: Dict[str, Tuple[int, int]] = {}
+            if changed:
+                ranges = {pid: (lo, hi) for pid, lo, hi in self._query("freshness_range", f"""
+                SELECT _partition_id, min(timestamp), max(timestamp)
+                FROM {self.database}.{self.table}
+                WHERE _partition_id IN %(partitions)s
+                GROUP BY _partition_id
+                """, {"partitions": tuple(changed)})}
+
+            partitions = {}
+            for pid, modified, n_rows, parts in rows:
+                if pid in ranges:
+                    partitions[pid] = PartitionMark(modified, n_rows, parts, *ranges[pid])
+                elif pid in current and pid not in changed:
+                    partitions[pid] = current[pid]
+
+            if partitions != current:
+                self.partitions = partitions
+                self.version += 1
+                logger.info(f"Data changed in {len(changed)} partition(s), freshness version {self.version}")
+            self.ok = True
+        except Exception as e:
+            logger.warning(f"Freshness probe failed: {e}")
+            self.ok = False
+
+    def window_version(self, window: Optional[Tuple[int, int]] = None) -> Optional[tuple]:
+        """返回与时间窗口（毫秒区间，None表示全表）相交的分区水位；窗口内数据不变时返回值不变。
+        探测失败时返回None（调用方退化为仅按TTL缓存）"""
+        self.refresh()
+        if not self.ok:
+            return None
+        partitions = self.partitions
+        return tuple(sorted(
+            (pid, mark.modified, mark.rows, mark.parts)
+            for pid, mark in partitions.items()
+            if window is None or (mark.min_ts <= window[1] and mark.max_ts >= window[0])
+        ))
+
+    def watermark(self) -> Optional[str]:
+        """全表数据版本标识；只由分区水位计算（不含进程内的 version 计数），各worker对相同数据得到相同结果"""
+        marks = self.window_version()
+        if marks is None:
+            return None
+        if not marks:
+            return "empty"
+        modified = max(mark[1] for mark in marks)
+        rows = sum(mark[2] for mark in marks)
+        digest = hashlib.sha1(repr(marks).encode()).hexdigest()[:8]
+        return f"{modified:%Y%m%d%H%M%S}-{rows}-{len(marks)}-{digest}"
+
+    def time_range(self) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        """由分区水位得到数据的时间戳范围（毫秒），无需扫描表；探测失败时返回None"""
+        self.refresh()
+        if not self.ok:
+            return None
+        partitions = list(self.partitions.values())
+        if not partitions:
+            return None, None
+        return min(mark.min_ts for mark in partitions), max(mark.max_ts for mark in partitions)
+
+    def metrics(self) -> List[str]:
+        age = time.monotonic() - self._last_probe if self._last_probe else -1
+        return [
+            "# HELP freshness_partitions Partitions tracked by the freshness watermark",
+            "# TYPE freshness_partitions gauge",
+            f"freshness_partitions {len(self.partitions)}",
+            "# HELP freshness_version Number of observed data changes since start",
+            "# TYPE freshness_version counter",
+            f"freshness_version {self.version}",
+            "# HELP freshness_probe_age_seconds Seconds since the last system.parts probe",
+            "# TYPE freshness_probe_age_seconds gauge",
+            f"freshness_probe_age_seconds {age}",
+        ]
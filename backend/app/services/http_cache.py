@@ -0,0 +1,41 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# 条件请求的缓存策略：客户端可以缓存，但每次使用前必须用ETag重新验证
+CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(request: Request, watermark: Optional[str]) -> Optional[str]:
+    """由数据水位、路径和查询参数计算强ETag；没有水位（如模拟数据）时不生成"""
+    if not watermark:
+        return None
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{watermark}|{request.url.path}|{query}".encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _match(if_none_match: str, etag: str) -> Optional[str]:
+    """返回 If-None-Match 中与etag匹配的标签，没有匹配时返回None"""
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in (t.strip() for t in if_none_match.split(",")):
+        # 忽略代理加上的 W/ 前缀和压缩中间件加上的编码后缀（如 "abc-gzip"）
+        opaque = tag[2:] if tag.startswith("W/") else tag
+        if opaque == etag or (opaque.startswith(etag[:-1] + "-") and opaque.endswith('"')):
+            return tag
+    return None
+
+
+def conditional_response(request: Request, response: Response, etag: Optional[str]) -> Optional[Response]:
+    """ETag匹配时返回304响应，否则在response上设置ETag并返回None"""
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    matched = _match(if_none_match, etag) if if_none_match else None
+    if matched:
+        return Response(status_code=304, headers=dict(headers, ETag=matched, Vary="Accept-Encoding"))
+    response.headers.update(headers)
+    return None
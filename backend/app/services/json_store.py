@@ -0,0 +1,218 @@
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，仅使用进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """JSON文件存储：按唯一键和ID建立索引，变更加锁并原子写入文件
+
+    多个worker进程共享同一个文件：写操作持有文件锁并在写前重新加载，
+    读操作按check_interval检查文件签名，发现其他进程的修改后自动重新加载。
+    """
+
+    duplicate_message = "Key already exists"
+
+    def __init__(self, path: str, key_field: str, defaults: Optional[Dict[str, dict]] = None,
+                 check_interval: float = 1.0):
+        self.path = path
+        self.key_field = key_field
+        self.lock_path = f"{path}.lock"
+        self.check_interval = check_interval
+        # 每次数据变化（本进程修改或检测到外部修改）时递增
+        self.version = 0
+        self._defaults = defaults or {}
+        self._lock = threading.RLock()
+        self._by_key: Dict[str, dict] = {}
+        self._by_id: Dict[int, dict] = {}
+        self._next_id = 1
+        self._file_sig = None
+        self._last_check = 0.0
+        self._listeners: List[Callable[[str, Optional[dict]], None]] = []
+        self._dirty = False
+
+        with self._lock, self._process_lock():
+            if not self._load_file():
+                self._index(copy.deepcopy(self._defaults))
+                self._save()
+
+    # ---- 内部方法 ----
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _index(self, items: Dict[str, dict]) -> None:
+        self._by_key = {key: dict(item) for key, item in items.items()}
+        self._by_id = {item["id"]: item for item in self._by_key.values()}
+        self._next_id = max(self._by_id, default=0) + 1
+
+    def _load_file(self) -> bool:
+        """从文件加载数据，成功返回True"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {self.path}: {e}")
+            return False
+        self._index(items)
+        self._file_sig = self._file_signature()
+        self._last_check = time.monotonic()
+        self.version += 1
+        return True
+
+    def _save(self) -> None:
+        """原子写入：先写临时文件并fsync，再rename覆盖"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._by_key, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._file_sig = self._file_signature()
+        self._last_check = time.monotonic()
+
+    @contextmanager
+    def _process_lock(self):
+        """跨进程文件锁"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _sync(self, force: bool = False) -> None:
+        """检测其他进程对文件的修改并重新加载"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        if self._file_signature() != self._file_sig and self._load_file():
+            logger.info(f"{self.path} changed on disk, reloaded")
+            self._notify("reload", None)
+
+    def _notify(self, event: str, item: Optional[dict]) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(event, item)
+            except Exception as e:
+                logger.error(f"Store listener failed: {e}")
+
+    @contextmanager
+    def _mutation(self):
+        """写操作上下文：加锁、写前同步，失败时从文件恢复"""
+        with self._lock, self._process_lock():
+            self._sync(force=True)
+            self._dirty = False
+            try:
+                yield
+                if self._dirty:
+                    self._save()
+            except Exception:
+                if self._dirty and not self._load_file():
+                    self._index(copy.deepcopy(self._defaults))
+                raise
+            if self._dirty:
+                self.version += 1
+
+    # ---- 查询 ----
+
+    def subscribe(self, listener: Callable[[str, Optional[dict]], None]) -> None:
+        """注册变更监听器，事件为 create/update/delete/reload"""
+        self._listeners.append(listener)
+
+    def refresh(self) -> None:
+        """按检查间隔同步其他进程的修改"""
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._sync()
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        with self._lock:
+            self._sync()
+            item = self._by_key.get(key)
+            return dict(item) if item else None
+
+    def get_by_id(self, item_id: int) -> Optional[dict]:
+        with self._lock:
+            self._sync()
+            item = self._by_id.get(item_id)
+            return dict(item) if item else None
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            self._sync()
+            return [dict(self._by_id[item_id]) for item_id in sorted(self._by_id)]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    # ---- 修改 ----
+
+    def create(self, key: str, fields: Dict[str, Any]) -> dict:
+        """创建记录，键已存在时抛出ValueError"""
+        with self._mutation():
+            if key in self._by_key:
+                raise ValueError(self.duplicate_message)
+            item = {"id": self._next_id, self.key_field: key, **fields}
+            self._by_key[key] = item
+            self._by_id[item["id"]] = item
+            self._next_id += 1
+            self._dirty = True
+            created = dict(item)
+        self._notify("create", created)
+        return created
+
+    def update(self, item_id: int, fields: Dict[str, Any]) -> Optional[dict]:
+        """更新记录字段（不含唯一键），记录不存在时返回None"""
+        with self._mutation():
+            item = self._by_id.get(item_id)
+            if item is None:
+                return None
+            item.update({k: v for k, v in fields.items() if k != self.key_field})
+            self._dirty = True
+            updated = dict(item)
+        self._notify("update", updated)
+        return updated
+
+    def delete(self, item_id: int) -> Optional[dict]:
+        """删除记录，记录不存在时返回None"""
+        with self._mutation():
+            item = self._by_id.pop(item_id, None)
+            if item is None:
+                return None
+            del self._by_key[item[self.key_field]]
+            self._dirty = True
+            deleted = dict(item)
+        self._notify("delete", deleted)
+        return deleted
@@ -0,0 +1,42 @@
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，每个进程都视为持有锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """多worker部署时用文件锁选出唯一执行后台任务的进程；进程退出时锁自动释放，其他进程可接替"""
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None or fcntl is None
+
+    def acquire(self) -> bool:
+        """尝试获取锁（不阻塞），已持有时直接返回True"""
+        if self.held:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        logger.info(f"{self.name} acquired leadership")
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.services.session_block import SessionBlock
+
+# 预读结果的有效期（秒）、初始/最大预读页数
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "60"))
+PREFETCH_INITIAL_PAGES = int(os.getenv("PREFETCH_INITIAL_PAGES", "1"))
+PREFETCH_MAX_PAGES = int(os.getenv("PREFETCH_MAX_PAGES", "8"))
+# 每个用户最多缓存的行数和过滤条件数、最多跟踪的用户数
+PREFETCH_MAX_ROWS_PER_USER = int(os.getenv("PREFETCH_MAX_ROWS_PER_USER", "2000"))
+PREFETCH_MAX_FILTERS_PER_USER = int(os.getenv("PREFETCH_MAX_FILTERS_PER_USER", "4"))
+PREFETCH_MAX_USERS = int(os.getenv("PREFETCH_MAX_USERS", "200"))
+
+
+class _Block:
+    """某个过滤条件下连续的一段已取回的行（列式紧凑格式）"""
+
+    __slots__ = ("start", "rows", "total", "version", "expires", "window", "hits")
+
+    def __init__(self, window: int):
+        self.start = 0
+        self.rows: SessionBlock = SessionBlock.from_dicts([])
+        self.total = 0
+        self.version = None
+        self.expires = 0.0
+        self.window = window
+        self.hits = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.rows)
+
+
+class PagePrefetcher:
+    """会话列表翻页预读：按（用户，过滤条件）缓存当前页之后的若干页，预读页数随翻页行为自适应
+
+    预读在同一条查询中完成（LIMIT 扩大为多页），不增加查询次数；
+    顺序翻到已取回部分之后时加倍预读页数，预读的页没有被使用时减半（至少预读1页）。
+    """
+
+    def __init__(self,
+                 ttl: float = PREFETCH_TTL,
+                 initial_pages: int = PREFETCH_INITIAL_PAGES,
+                 max_pages: int = PREFETCH_MAX_PAGES,
+                 max_rows_per_user: int = PREFETCH_MAX_ROWS_PER_USER,
+                 max_filters_per_user: int = PREFETCH_MAX_FILTERS_PER_USER,
+                 max_users: int = PREFETCH_MAX_USERS):
+        self.ttl = ttl
+        self.initial_pages = initial_pages
+        self.max_pages = max_pages
+        self.max_rows_per_user = max_rows_per_user
+        self.max_filters_per_user = max_filters_per_user
+        self.max_users = max_users
+        self._users: "OrderedDict[str, OrderedDict[Hashable, _Block]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _blocks(self, user: str) -> "OrderedDict[Hashable, _Block]":
+        blocks = self._users.get(user)
+        if blocks is None:
+            blocks = self._users[user] = OrderedDict()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user)
+        return blocks
+
+    def get_page(self, user: str, key: Hashable, version: Any, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        """命中预读时返回 {"data": SessionBlock, "total"}，否则返回None并据此调整预读页数"""
+        with self._lock:
+            block = self._blocks(user).get(key)
+            if block is None:
+                self.misses += 1
+                return None
+
+            valid = block.version == version and block.expires > time.monotonic()
+            # 最后一页可能不足一页
+            covered = block.start <= offset and (offset + limit <= block.end or block.end >= block.total)
+            if valid and covered:
+                if offset >= block.start + limit:
+                    block.hits += 1
+                self.hits += 1
+                rows = block.rows[offset - block.start:offset - block.start + limit]
+                return {"data": rows, "total": block.total}
+
+            self.misses += 1
+            if valid and offset == block.end:
+                # 顺序翻页读完了已取回的页（包括预读页太少、尚未命中的情况）：扩大预读
+                block.window = min(self.max_pages, max(1, block.window * 2))
+            elif not block.hits:
+                # 预读的页没有用上（跳页、过期或数据变化）：缩小预读，但不低于1页，
+                # 否则不再预读、也就不会再有命中来扩大预读
+                block.window = max(1, block.window // 2)
+            return None
+
+    def fetch_size(self, user: str, key: Hashable, limit: int) -> int:
+        """未命中时本次应查询的行数（当前页 + 预读页），受每用户内存上限约束"""
+        with self._lock:
+            block = self._blocks(user).get(key)
+            window = block.window if block is not None else self.initial_pages
+        return max(limit, min(limit * (1 + window), self.max_rows_per_user))
+
+    def known_total(self, user: str, key: Hashable, version: Any) -> Optional[int]:
+        """同一过滤条件下数据未变化时复用已知总数，省去count查询"""
+        with self._lock:
+            block = self._blocks(user).get(key)
+            if block is not None and block.version == version and block.expires > time.monotonic():
+                return block.total
+        return None
+
+    def store(self, user: str, key: Hashable, version: Any, offset: int,
+              rows: SessionBlock, total: int) -> None:
+        """保存本次查询取回的行，超过每用户上限时淘汰最久未用的过滤条件"""
+        if version is None:
+            return
+        with self._lock:
+            blocks = self._blocks(user)
+            block = blocks.get(key) or _Block(self.initial_pages)
+            block.start = offset
+            block.rows = rows
+            block.total = total
+            block.version = version
+            block.expires = time.monotonic() + self.ttl
+            block.hits = 0
+            blocks[key] = block
+            blocks.move_to_end(key)
+
+            while len(blocks) > 1 and (
+                    len(blocks) > self.max_filters_per_user
+                    or sum(len(b.rows) for b in blocks.values()) > self.max_rows_per_user):
+                blocks.popitem(last=False)
+
+    def clear(self, user: Optional[str] = None) -> None:
+        with self._lock:
+            if user is None:
+                self._users.clear()
+            else:
+                self._users.pop(user, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": sum(len(b.rows) for blocks in self._users.values() for b in blocks.values()),
+                "maxsize": self.max_rows_per_user * self.max_users,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,124 @@
+import asyncio
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.services.cache import TTLCache
+from app.services.metrics import registry
+
+# bcrypt成本因子，调整后旧哈希会在用户下次登录时自动重新计算
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 哈希线程池大小及排队上限（bcrypt计算期间会释放GIL）
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "200"))
+# 登录失败限流：窗口内同一用户名+来源IP允许的失败次数
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+
+password_hash_pending = registry.gauge(
+    "password_hash_pending", "Password hash/verify tasks queued or running")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashQueueFull(Exception):
+    """哈希任务排队数超过上限"""
+
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希与校验，避免阻塞事件循环"""
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwd-hash")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise HashQueueFull()
+            self._pending += 1
+        password_hash_pending.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            password_hash_pending.dec()
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """校验密码，返回(是否通过, 需要更新时的新哈希)"""
+        if stored is None:
+            # 用户不存在时也执行一次校验，避免通过响应时间枚举用户名
+            await self._submit(_dummy_verify, password)
+            return False, None
+        return await self._submit(verify_and_update, password, stored)
+
+
+def hash_password(password: str) -> str:
+    """生成加盐的bcrypt哈希"""
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, stored: str) -> Tuple[bool, Optional[str]]:
+    """校验密码；成本因子变化或历史明文存储时返回新哈希"""
+    if pwd_context.identify(stored, required=False) is None:
+        # 兼容历史明文密码，校验通过后升级为哈希
+        if hmac.compare_digest(password.encode(), stored.encode()):
+            return True, pwd_context.hash(password)
+        return False, None
+    return pwd_context.verify_and_update(password, stored)
+
+
+_dummy_hash: Optional[str] = None
+
+
+def _dummy_verify(password: str) -> bool:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = pwd_context.hash("dummy-password")
+    return pwd_context.verify(password, _dummy_hash)
+
+
+class LoginRateLimiter:
+    """按 用户名+来源IP 统计窗口内的登录失败次数"""
+
+    def __init__(self, max_failures: int = LOGIN_MAX_FAILURES, window: float = LOGIN_FAILURE_WINDOW):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = TTLCache(maxsize=10000, ttl=window)
+
+    def retry_after(self, key: str) -> int:
+        """被限流时返回需要等待的秒数，否则返回0"""
+        now = time.time()
+        failures = [t for t in self._failures.get(key, []) if t > now - self.window]
+        if len(failures) < self.max_failures:
+            return 0
+        return max(1, int(failures[0] + self.window - now))
+
+    def record_failure(self, key: str) -> None:
+        now = time.time()
+        failures = [t for t in self._failures.get(key, []) if t > now - self.window]
+        failures.append(now)
+        self._failures.set(key, failures[-self.max_failures:])
+
+    def reset(self, key: str) -> None:
+        self._failures.pop(key)
+
+
+password_hasher = PasswordHasher()
+login_rate_limiter = LoginRateLimiter()
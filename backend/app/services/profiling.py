@@ -0,0 +1,316 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+
+from app.services.request_context import request_state_var
+
+logger = logging.getLogger(__name__)
+
+# 请求头 X-Profile: 1 输出阶段耗时，X-Profile: flame 同时采样调用栈（仅管理员生效）
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+# 按比例抽样记录阶段耗时（0 关闭），保存在内存中供管理员查看
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HISTORY = int(os.getenv("PROFILE_HISTORY", "200"))
+# 调用栈采样：输出目录、采样间隔（毫秒）、单个请求最长采样时间（秒）、最多保留的文件数
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+# Server-Timing 中阶段的输出顺序
+PHASES = ("auth", "query_build", "pool_wait", "clickhouse", "conversion", "validation", "serialization")
+# 空闲线程的栈顶所在文件，采样时跳过
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+# 剖析结果中说明调用栈采样的范围
+SAMPLED_THREADS_NOTE = ("事件循环线程（可能包含同时处理的其他请求）及执行本请求阶段（鉴权、ClickHouse查询、转换、"
+                        "流式导出编码等）期间的线程池线程；线程池中不属于这些阶段的代码不会被采样")
+
+
+class StackSampler:
+    """采样调用栈的后台线程，输出折叠栈格式（flamegraph.pl、speedscope 可直接读取）；
+    指定 threads 时每次只采样其返回的线程"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, max_seconds: float = PROFILE_MAX_SECONDS,
+                 threads: Optional[Callable[[], Iterable[int]]] = None):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.threads = threads
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            allowed = set(self.threads()) if self.threads is not None else None
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (allowed is not None and ident not in allowed) \
+                        or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """单个请求的阶段耗时；阶段可能在线程池中记录，累加时加锁
+
+    在事件循环中创建，记下事件循环线程；线程池线程在执行本请求的阶段期间登记，
+    调用栈只采样这些线程，不包括同时处理其他请求的线程池线程。
+    """
+
+    def __init__(self, request_id: str, method: str, path: str, mode: Optional[str], sampled: bool):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.mode = mode  # 请求头要求的模式：timing / flame
+        self.sampled = sampled
+        self.allowed = False  # 请求者是管理员时才输出 Server-Timing
+        self.user: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.endpoint_done: Optional[float] = None
+        self.headers_sent: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.sampler: Optional[StackSampler] = None
+        self.loop_thread = threading.get_ident()
+        self._active: Dict[int, int] = {}  # 正在执行本请求阶段的线程 -> 嵌套层数
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def enter(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = self._active.get(ident, 0) + 1
+
+    def leave(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._active.get(ident, 0) - 1
+            if depth > 0:
+                self._active[ident] = depth
+            else:
+                self._active.pop(ident, None)
+
+    def threads(self) -> List[int]:
+        """当前属于本请求的线程：事件循环线程和正在执行本请求阶段的线程"""
+        with self._lock:
+            return [self.loop_thread, *self._active]
+
+    def authorize(self, user: dict) -> None:
+        """鉴权完成后调用：管理员请求的剖析才生效，flame 模式此时开始采样"""
+        self.user = user.get("username")
+        if self.mode and user.get("role") == "admin":
+            self.allowed = True
+            if self.mode == "flame" and self.sampler is None:
+                self.sampler = StackSampler(threads=self.threads)
+                self.sampler.start()
+
+    def timings(self) -> Dict[str, float]:
+        """各阶段耗时（毫秒）；响应体发送完成后包含 body（流式响应的生成与发送），
+        未归入任何阶段的部分记为 other"""
+        with self._lock:
+            phases = dict(self.phases)
+        if self.endpoint_done is not None and self.headers_sent is not None:
+            phases["serialization"] = self.headers_sent - self.endpoint_done
+        if self.finished is not None and self.headers_sent is not None:
+            phases["body"] = self.finished - self.headers_sent
+        total = (self.finished or self.headers_sent or time.perf_counter()) - self.started
+        result = {name: round(phases[name] * 1000, 2) for name in PHASES if name in phases}
+        result.update({name: round(value * 1000, 2) for name, value in phases.items() if name not in PHASES})
+        result["other"] = round(max(0.0, total - sum(phases.values())) * 1000, 2)
+        result["total"] = round(total * 1000, 2)
+        return result
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={value}" for name, value in self.timings().items())
+
+
+class ProfileStore:
+    """最近的剖析结果（内存）与调用栈文件（磁盘）"""
+
+    def __init__(self, directory: str = PROFILE_DIR, history: int = PROFILE_HISTORY):
+        self.directory = directory
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        entry = {
+            "request_id": profile.request_id,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": profile.method,
+            "path": profile.path,
+            "user": profile.user,
+            "sampled": profile.sampled,
+            "timings_ms": profile.timings(),
+            "flame": None
+        }
+        if profile.sampler is not None:
+            entry["samples"] = profile.sampler.samples
+            entry["sampled_threads"] = SAMPLED_THREADS_NOTE
+            try:
+                entry["flame"] = self._write_flame(profile.request_id, profile.sampler.folded())
+            except OSError as e:
+                logger.error(f"Failed to write flame profile: {e}")
+        with self._lock:
+            self.entries.append(entry)
+
+    def _write_flame(self, request_id: str, folded: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{int(time.time() * 1000)}-{request_id}.folded"
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            f.write(folded)
+        files = sorted(n for n in os.listdir(self.directory) if n.endswith(".folded"))
+        for old in files[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+            try:
+                os.unlink(os.path.join(self.directory, old))
+            except OSError:
+                pass
+        return name
+
+    def list(self, limit: int = 50, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self.entries)
+        entries = [e for e in reversed(entries) if path is None or e["path"] == path]
+        return entries[:limit]
+
+    def flame(self, name: str) -> Optional[str]:
+        """读取调用栈文件；只接受本目录下生成的文件名"""
+        if os.path.basename(name) != name or not name.endswith(".folded"):
+            return None
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+
+profile_store = ProfileStore()
+
+
+def start_profile(request_id: str, method: str, path: str, header: Optional[str]) -> Optional[RequestProfile]:
+    """按请求头或抽样决定是否剖析该请求"""
+    header = (header or "").strip().lower()
+    mode = "flame" if header == "flame" else ("timing" if header in ("1", "true", "timing") else None)
+    sampled = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if mode is None and not sampled:
+        return None
+    return RequestProfile(request_id, method, path, mode, sampled)
+
+
+def finish_profile(profile: RequestProfile) -> None:
+    """响应发送完成后调用：停止采样，管理员请求或抽样的结果写入存储"""
+    profile.finished = time.perf_counter()
+    if profile.sampler is not None:
+        profile.sampler.stop()
+    if profile.allowed or profile.sampled:
+        profile_store.add(profile)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    state = request_state_var.get()
+    return state.get("profile") if state else None
+
+
+def add_phase(name: str, seconds: float) -> None:
+    """记录当前请求某个阶段的耗时（未剖析时无操作）"""
+    profile = current_profile()
+    if profile is not None:
+        profile.add(name, seconds)
+
+
+@contextmanager
+def request_thread() -> Iterator[None]:
+    """代码块执行期间把当前线程登记为当前请求的线程，供调用栈采样（未剖析时无操作）"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    profile.enter()
+    try:
+        yield
+    finally:
+        profile.leave()
+
+
+def iter_in_request_thread(iterator: Iterable[bytes]) -> Iterator[bytes]:
+    """流式响应体的同步生成器在线程池中逐块执行，生成每一块时登记当前线程"""
+    iterator = iter(iterator)
+    while True:
+        with request_thread():
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """计时代码块并计入当前请求的阶段耗时"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    profile.enter()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+        profile.leave()
+
+
+class ProfiledRoute(APIRoute):
+    """记录端点函数返回的时间，之后到响应头发出之间的耗时即响应模型校验与JSON序列化"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    profile = current_profile()
+                    if profile is not None:
+                        profile.endpoint_done = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.clickhouse_service import get_clickhouse_service
+
+logger = logging.getLogger(__name__)
+
+# 每个批量请求最多包含的子查询数、最多同时执行的子查询数
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+FILTER_FIELDS = ("src_ip", "dst_ip", "protocol", "app_name")
+
+# 子查询参数：名称 -> (类型, 默认值, 最小值, 最大值)
+PARAM_SPECS: Dict[str, Dict[str, Tuple[type, Any, Optional[int], Optional[int]]]] = {
+    "sessions": {"page": (int, 1, 1, None), "size": (int, 20, 1, 100)},
+    "stats": {"compare_to": (str, None, None, None)},
+    "top_ips": {"limit": (int, 10, 1, 50), "compare_to": (str, None, None, None)},
+    "protocols": {"compare_to": (str, None, None, None)},
+    "histogram": {"interval": (str, None, None, None)},
+    "graph": {
+        "max_edges": (int, 300, 1, 5000), "max_degree": (int, 25, 1, 500),
+        "weight": (str, "bytes", None, None),
+        "subnet_v4": (int, None, 0, 32), "subnet_v6": (int, None, 0, 128),
+    },
+}
+# 只支持时间范围、不支持IP/协议/应用过滤的聚合类查询
+TIME_ONLY_KINDS = ("stats", "top_ips", "protocols")
+
+
+def _check_params(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """按参数表校验子查询参数并补齐默认值"""
+    specs = PARAM_SPECS[kind]
+    unknown = set(params) - set(specs)
+    if unknown:
+        raise ValueError(f"{kind} 不支持参数: {', '.join(sorted(unknown))}")
+    checked = {}
+    for name, (kind_type, default, low, high) in specs.items():
+        value = params.get(name, default)
+        if value is not None:
+            if kind_type is int and (isinstance(value, bool) or not isinstance(value, int)):
+                raise ValueError(f"参数 {name} 应为整数")
+            if kind_type is str and not isinstance(value, str):
+                raise ValueError(f"参数 {name} 应为字符串")
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise ValueError(f"参数 {name} 超出范围")
+        checked[name] = value
+    return checked
+
+
+def validate_batch(filters: Dict[str, Any], queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """校验共享过滤条件和子查询，返回补齐默认参数后的子查询；无效时抛出ValueError"""
+    if not queries:
+        raise ValueError("至少需要一个子查询")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"子查询数量超过上限 {BATCH_MAX_QUERIES}")
+
+    start_time, end_time = filters.get("start_time"), filters.get("end_time")
+    if bool(start_time) != bool(end_time):
+        raise ValueError("start_time 和 end_time 需要同时指定")
+    get_clickhouse_service()._time_bounds(start_time, end_time)
+    has_filters = any(filters.get(field) for field in FILTER_FIELDS)
+
+    checked = []
+    names = set()
+    for query in queries:
+        name, kind = query["name"], query["kind"]
+        if name in names:
+            raise ValueError(f"子查询名称重复: {name}")
+        names.add(name)
+        if kind not in PARAM_SPECS:
+            raise ValueError(f"无效的查询类型: {kind}，应为 {', '.join(PARAM_SPECS)}")
+        if kind in TIME_ONLY_KINDS and has_filters:
+            raise ValueError(f"{name}: 聚合类查询只支持时间范围，不支持过滤条件")
+        try:
+            params = _check_params(kind, query.get("params") or {})
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}")
+        checked.append({"name": name, "kind": kind, "params": params})
+    return checked
+
+
+def _run_query(kind: str, params: Dict[str, Any], filters: Dict[str, Any], user: str) -> Any:
+    """在线程池中执行单个子查询，结果格式与对应的单独接口一致"""
+    service = get_clickhouse_service()
+    start_time, end_time = filters.get("start_time"), filters.get("end_time")
+    where = {field: filters.get(field) for field in FILTER_FIELDS}
+
+    if kind == "sessions":
+        page, size = params["page"], params["size"]
+        result = service.get_session_data(start_time=start_time, end_time=end_time, limit=size,
+                                          offset=(page - 1) * size, user=user, **where)
+        return {"data": result["data"], "total": result["total"], "page": page, "size": size}
+    if kind == "stats":
+        if params["compare_to"]:
+            return service.compare_session_stats(start_time, end_time, params["compare_to"])
+        stats = service.get_session_stats(start_time=start_time, end_time=end_time)
+        return {key: stats[key] for key in
+                ("total_sessions", "total_packets", "total_traffic", "unique_ips", "last_activity")}
+    if kind == "top_ips":
+        if params["compare_to"]:
+            return service.compare_top_ips(start_time, end_time, params["compare_to"], limit=params["limit"])
+        return [{"ip": row["ip"], "session_count": row["sessions"], "total_bytes": row["traffic_bytes"]}
+                for row in service.get_top_ips(limit=params["limit"], start_time=start_time, end_time=end_time)]
+    if kind == "protocols":
+        if params["compare_to"]:
+            return service.compare_protocol_stats(start_time, end_time, params["compare_to"])
+        return service.get_protocol_stats(start_time=start_time, end_time=end_time)
+    if kind == "histogram":
+        return service.get_traffic_histogram(start_time=start_time, end_time=end_time,
+                                             interval=params["interval"], **where)
+    return service.get_host_graph(start_time=start_time, end_time=end_time, **where, **params)
+
+
+def _line(item: Dict[str, Any]) -> bytes:
+    return (json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def run_batch(queries: List[Dict[str, Any]], filters: Dict[str, Any], user: str,
+                    concurrency: int = BATCH_CONCURRENCY,
+                    runner: Callable = _run_query) -> AsyncIterator[bytes]:
+    """并发执行子查询（同时最多 concurrency 个），每完成一个即输出一行NDJSON，最后输出汇总行"""
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, BATCH_CONCURRENCY)))
+    started = time.perf_counter()
+
+    async def execute(query: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            query_started = time.perf_counter()
+            item = {"name": query["name"], "kind": query["kind"]}
+            try:
+                item["result"] = await run_in_threadpool(runner, query["kind"], query["params"], filters, user)
+                item["status"] = "ok"
+            except ValueError as e:
+                item.update(status="error", error=str(e))
+            except Exception as e:
+                logger.error(f"Batch query {query['name']} failed: {e}")
+                item.update(status="error", error=f"查询失败: {e}")
+            item["elapsed_ms"] = round((time.perf_counter() - query_started) * 1000, 1)
+            return item
+
+    tasks = [asyncio.ensure_future(execute(query)) for query in queries]
+    errors = 0
+    try:
+        for future in asyncio.as_completed(tasks):
+            item = await future
+            errors += item["status"] != "ok"
+            yield _line(item)
+        yield _line({
+            "done": True,
+            "queries": len(queries),
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+    finally:
+        # 客户端断开时取消尚未开始的子查询
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,31 @@
+import contextvars
+import uuid
+from typing import Any, Dict, Optional
+
+# 当前请求ID，用于关联API日志与ClickHouse的 system.query_log
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+# 当前请求的可变状态；同步依赖在线程池中执行，修改共享的字典才能把信息带回请求上下文
+request_state_var: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("request_state", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def new_query_id() -> str:
+    """生成ClickHouse query_id：在请求上下文中以请求ID为前缀"""
+    request_id = request_id_var.get()
+    suffix = uuid.uuid4().hex[:8]
+    return f"{request_id}-{suffix}" if request_id else suffix
+
+
+def set_current_user(username: str) -> None:
+    """记录当前请求的用户名"""
+    state = request_state_var.get()
+    if state is not None:
+        state["user"] = username
+
+
+def current_username() -> Optional[str]:
+    state = request_state_var.get()
+    return state.get("user") if state else None
@@ -0,0 +1,268 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.clickhouse_service import get_clickhouse_service, parse_compare_offset
+from app.services.json_store import JsonStore
+from app.services.leader_lock import LeaderLock
+from app.services.session_block import SESSION_COLUMNS, SessionBlock
+from app.services.snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+SAVED_QUERIES_FILE = os.getenv("SAVED_QUERIES_FILE", "saved_queries.json")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# 每个查询默认保留的快照数、快照最长保留天数
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", "7"))
+SNAPSHOT_MAX_AGE_DAYS = float(os.getenv("SNAPSHOT_MAX_AGE_DAYS", "30"))
+# 调度器检查间隔（秒）
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "30"))
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "True").lower() == "true"
+# 调度执行失败后的首次重试间隔（秒），之后每次失败加倍，最长不超过查询自身的调度周期
+SCHEDULER_RETRY_BASE = float(os.getenv("SCHEDULER_RETRY_BASE", "60"))
+
+QUERY_KINDS = ("sessions", "stats", "top_ips", "protocols")
+FILTER_FIELDS = ("src_ip", "dst_ip", "protocol", "app_name")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_DAILY = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$")
+
+
+class SnapshotUnavailable(Exception):
+    """执行完成后仍读取不到快照（如快照文件损坏或被并发清理）"""
+
+
+def parse_schedule(schedule: str) -> Tuple[str, Any]:
+    """解析调度：间隔（如 15m、1h、1d）或每天固定时间（如 07:30）"""
+    match = _DAILY.match(schedule.strip())
+    if match:
+        return "daily", (int(match.group(1)), int(match.group(2)))
+    try:
+        return "interval", parse_compare_offset(schedule)
+    except ValueError:
+        raise ValueError(f"无效的调度: {schedule}，应为如 15m、1h、1d 的间隔或 HH:MM 的每日时间")
+
+
+def next_run_ms(schedule: str, last_ms: Optional[int], now_ms: int) -> int:
+    """下一次执行时间（毫秒）；从未执行过时立即执行"""
+    if last_ms is None:
+        return now_ms
+    kind, value = parse_schedule(schedule)
+    if kind == "interval":
+        return last_ms + value
+    hour, minute = value
+    last = datetime.fromtimestamp(last_ms / 1000)
+    run = last.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run <= last:
+        run += timedelta(days=1)
+    return int(run.timestamp() * 1000)
+
+
+def retry_delay_ms(schedule: str, failures: int) -> int:
+    """连续失败 failures 次后距下一次重试的时间（毫秒）：指数退避，不超过调度周期"""
+    kind, value = parse_schedule(schedule)
+    period = value if kind == "interval" else 24 * 3600 * 1000
+    return int(min(period, SCHEDULER_RETRY_BASE * 1000 * 2 ** max(0, failures - 1)))
+
+
+def validate_query(fields: Dict[str, Any]) -> None:
+    """校验保存的查询定义，无效时抛出ValueError"""
+    if fields.get("kind") not in QUERY_KINDS:
+        raise ValueError(f"无效的查询类型: {fields.get('kind')}，应为 {', '.join(QUERY_KINDS)}")
+    if fields.get("range"):
+        parse_compare_offset(fields["range"])
+    elif bool(fields.get("start_time")) != bool(fields.get("end_time")):
+        raise ValueError("start_time 和 end_time 需要同时指定")
+    for key in ("start_time", "end_time"):
+        if fields.get(key):
+            try:
+                datetime.strptime(fields[key], TIME_FORMAT)
+            except ValueError:
+                raise ValueError(f"无效的时间格式: {fields[key]}")
+    if fields.get("schedule"):
+        parse_schedule(fields["schedule"])
+    if fields.get("kind") != "sessions" and any((fields.get("filters") or {}).values()):
+        raise ValueError("聚合类查询只支持时间范围，不支持过滤条件")
+
+
+class SavedQueryService:
+    """保存的查询：定义存储在JSON文件中，按调度在后台预先执行并保存结果快照"""
+
+    def __init__(self, path: str = SAVED_QUERIES_FILE, snapshot_dir: str = SNAPSHOT_DIR):
+        self.store = JsonStore(path, key_field="name")
+        self.store.duplicate_message = "Saved query name already exists"
+        self.snapshots = SnapshotStore(snapshot_dir, retention=SNAPSHOT_RETENTION,
+                                       max_age_days=SNAPSHOT_MAX_AGE_DAYS)
+        # 多worker时只有持有调度锁的进程执行调度
+        self.leader = LeaderLock(os.path.join(snapshot_dir, "scheduler.lock"), "Saved query scheduler")
+        self._running: set = set()
+        self._running_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 执行 ----
+
+    def _window(self, query: dict, now: datetime) -> Tuple[Optional[str], Optional[str]]:
+        if query.get("range"):
+            start = now - timedelta(milliseconds=parse_compare_offset(query["range"]))
+            return start.strftime(TIME_FORMAT), now.strftime(TIME_FORMAT)
+        return query.get("start_time"), query.get("end_time")
+
+    def execute(self, query: dict) -> Tuple[Dict[str, Any], Any]:
+        """执行查询，返回 (快照元数据, 结果)；会话明细以列式原始值保存。
+        ClickHouse不可用或查询失败时抛出异常，不会把模拟数据当作结果"""
+        service = get_clickhouse_service()
+        start_time, end_time = self._window(query, datetime.now())
+        limit = query.get("limit") or 1000
+        started = time.perf_counter()
+
+        kind = query["kind"]
+        if kind == "sessions":
+            block = service.export_sessions(start_time=start_time, end_time=end_time, limit=limit,
+                                            fallback=False, **(query.get("filters") or {}))
+            payload = {
+                "columns": {name: list(block.columns[name]) for name in SESSION_COLUMNS},
+                "rows": len(block),
+                "truncated": len(block) >= limit
+            }
+        elif kind == "stats":
+            payload = service.get_session_stats(start_time=start_time, end_time=end_time, fallback=False)
+        elif kind == "top_ips":
+            payload = service.get_top_ips(limit=min(limit, 50), start_time=start_time, end_time=end_time,
+                                          fallback=False)
+        else:
+            payload = service.get_protocol_stats(start_time=start_time, end_time=end_time, fallback=False)
+
+        meta = {
+            "query_id": query["id"],
+            "kind": kind,
+            "start_time": start_time,
+            "end_time": end_time,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        return meta, payload
+
+    def run(self, query_id: int) -> Optional[Dict[str, Any]]:
+        """立即执行并保存快照，返回快照元数据；查询不存在时返回None。同一查询同时只执行一次。
+        执行失败时不保存快照，失败原因记录在查询定义的 last_error 中，并重新抛出异常"""
+        query = self.store.get_by_id(query_id)
+        if query is None:
+            return None
+        with self._running_lock:
+            if query_id in self._running:
+                raise RuntimeError("查询正在执行中")
+            self._running.add(query_id)
+        try:
+            try:
+                meta, payload = self.execute(query)
+            except Exception as e:
+                self.store.update(query_id, {
+                    "last_error": str(e) or type(e).__name__,
+                    "last_error_time": datetime.now().strftime(TIME_FORMAT),
+                    "failures": (query.get("failures") or 0) + 1
+                })
+                raise
+            meta = self.snapshots.save(query_id, meta, payload)
+            self.snapshots.prune(query_id, query.get("retention") or SNAPSHOT_RETENTION)
+            if query.get("last_error") or query.get("failures"):
+                self.store.update(query_id, {"last_error": None, "last_error_time": None, "failures": 0})
+            logger.info(f"Saved query {query['name']} materialized in {meta['elapsed_ms']}ms")
+            return meta
+        finally:
+            with self._running_lock:
+                self._running.discard(query_id)
+
+    def result(self, query_id: int, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """返回最新快照及其时效；没有快照或要求刷新时先执行查询，执行后仍没有快照时抛出SnapshotUnavailable"""
+        query = self.store.get_by_id(query_id)
+        if query is None:
+            return None
+        snapshot = None if refresh else self.snapshots.latest(query_id)
+        if snapshot is None:
+            if self.run(query_id) is None:
+                return None
+            snapshot = self.snapshots.latest(query_id)
+            if snapshot is None:
+                raise SnapshotUnavailable("查询已执行，但没有可读取的快照")
+        meta, payload = snapshot
+
+        if query["kind"] == "sessions":
+            columns = payload["columns"]
+            block = SessionBlock.from_columns([columns[name] for name in SESSION_COLUMNS])
+            payload = {"data": block.to_dicts(), "rows": payload["rows"], "truncated": payload["truncated"]}
+
+        created_ms = meta["created_ms"]
+        return {
+            "query": query,
+            "snapshot_time": datetime.fromtimestamp(created_ms / 1000).strftime(TIME_FORMAT),
+            "age_seconds": round(time.time() - created_ms / 1000, 1),
+            "start_time": meta.get("start_time"),
+            "end_time": meta.get("end_time"),
+            "elapsed_ms": meta.get("elapsed_ms"),
+            "result": payload
+        }
+
+    def next_run(self, query: dict, now_ms: int, latest: Optional[int] = None) -> int:
+        """调度查询的下一次执行时间（毫秒）：按最新快照计算；上次执行失败时按失败次数退避重试"""
+        if latest is None:
+            latest = self.snapshots.latest_time(query["id"])
+        next_ms = next_run_ms(query["schedule"], latest, now_ms)
+        if query.get("failures") and query.get("last_error_time"):
+            failed_ms = int(datetime.strptime(query["last_error_time"], TIME_FORMAT).timestamp() * 1000)
+            next_ms = max(next_ms, failed_ms + retry_delay_ms(query["schedule"], query["failures"]))
+        return next_ms
+
+    def describe(self, query: dict) -> dict:
+        """查询定义附带最新快照时间和下一次执行时间"""
+        latest = self.snapshots.latest_time(query["id"])
+        item = dict(query)
+        item["last_snapshot"] = datetime.fromtimestamp(latest / 1000).strftime(TIME_FORMAT) if latest else None
+        item["next_run"] = None
+        if query.get("schedule"):
+            next_ms = self.next_run(query, int(time.time() * 1000), latest)
+            item["next_run"] = datetime.fromtimestamp(next_ms / 1000).strftime(TIME_FORMAT)
+        return item
+
+    # ---- 调度 ----
+
+    def run_due(self) -> List[int]:
+        """执行所有到期的查询，返回执行的查询ID"""
+        now_ms = int(time.time() * 1000)
+        executed = []
+        for query in self.store.all():
+            if not query.get("schedule") or self._stop.is_set():
+                continue
+            try:
+                if self.next_run(query, now_ms) > now_ms:
+                    continue
+                self.run(query["id"])
+                executed.append(query["id"])
+            except Exception as e:
+                logger.error(f"Scheduled query {query.get('name')} failed: {e}")
+        return executed
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if self.leader.acquire():
+                self.run_due()
+            self._stop.wait(SCHEDULER_TICK)
+
+    def start(self) -> None:
+        if self._thread is not None or not SCHEDULER_ENABLED:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="saved-query-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.leader.release()
+
+
+saved_query_service = SavedQueryService()
@@ -0,0 +1,169 @@
+import ipaddress
+import json
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# 会话明细的列（与 SessionData 字段顺序一致）
+SESSION_COLUMNS = [
+    'timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol',
+    'total_packets', 'total_bytes', 'up_packets', 'up_bytes', 'down_packets', 'down_bytes',
+    'duration', 'avg_pps', 'avg_bps', 'min_packet_size', 'max_packet_size', 'avg_packet_size',
+    'protocol_name', 'protocol_confidence', 'app_name', 'app_confidence', 'matched_domain',
+    'first_seen', 'last_seen', 'tcp_flags', 'retransmissions', 'out_of_order', 'lost_packets'
+]
+
+# 数值列在内存中的紧凑存储类型（array typecode）；IP为128位整数，字符串列保持原样。
+# 按常见表结构选择，表结构并不保证取值范围：放不下时依次退化为64位整数和普通元组，见 _compact_column
+COLUMN_TYPECODES = {
+    'timestamp': 'Q', 'first_seen': 'Q', 'last_seen': 'Q',
+    'src_port': 'H', 'dst_port': 'H',
+    'protocol': 'B', 'protocol_confidence': 'B', 'app_confidence': 'B', 'tcp_flags': 'B',
+    'total_packets': 'Q', 'total_bytes': 'Q', 'up_packets': 'Q', 'up_bytes': 'Q',
+    'down_packets': 'Q', 'down_bytes': 'Q',
+    'min_packet_size': 'L', 'max_packet_size': 'L',
+    'retransmissions': 'L', 'out_of_order': 'L', 'lost_packets': 'L',
+    'duration': 'd', 'avg_pps': 'd', 'avg_bps': 'd', 'avg_packet_size': 'd',
+}
+TIME_COLUMNS = ('timestamp', 'first_seen', 'last_seen')
+IP_COLUMNS = ('src_ip', 'dst_ip')
+
+
+def _compact_column(typecode: str, values: Sequence) -> Sequence:
+    """按紧凑类型存储一列；取值超出范围、为负数或含NULL时退化为更宽的类型或元组，不丢弃数据"""
+    candidates = (typecode, 'q') if typecode not in ('d', 'q') else (typecode,)
+    for code in candidates:
+        try:
+            return array(code, values)
+        except (OverflowError, TypeError):
+            continue
+    return tuple(values)
+
+
+def ip_num_sql(column: str) -> str:
+    """SQL：把IPv4/IPv6字符串转换为128位整数（IPv4映射为 ::ffff:a.b.c.d）"""
+    return f"reinterpretAsUInt128(reverse(IPv6StringToNumOrDefault({column})))"
+
+
+# 会话明细查询的列：时间保持毫秒时间戳，IP为整数，tcp_flags为位掩码
+COMPACT_SELECT = ",\n            ".join(
+    f"{ip_num_sql(c)} as {c}" if c in IP_COLUMNS else c for c in SESSION_COLUMNS
+)
+
+
+@lru_cache(maxsize=65536)
+def format_ip(value) -> str:
+    """128位整数IP转换为显示字符串（IPv4映射地址显示为IPv4）"""
+    if isinstance(value, str):
+        return value
+    address = ipaddress.IPv6Address(value)
+    mapped = address.ipv4_mapped
+    return str(mapped if mapped is not None else address)
+
+
+def parse_ip(value: str) -> int:
+    """IP字符串转换为128位整数，无效时返回0"""
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return 0
+    if address.version == 4:
+        return 0xFFFF00000000 | int(address)
+    return int(address)
+
+
+@lru_cache(maxsize=4096)
+def _format_second(second: int) -> str:
+    return datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_ms(value: int) -> str:
+    """毫秒时间戳转换为显示字符串（精确到秒）"""
+    return _format_second(value // 1000)
+
+
+class SessionBlock:
+    """列式存储的会话结果：数值列为 array，IP为整数；只在输出时转换为显示字符串"""
+
+    __slots__ = ("columns", "size")
+
+    def __init__(self, columns: Dict[str, Sequence], size: int):
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_columns(cls, columns: Sequence[Sequence]) -> "SessionBlock":
+        """由 execute(..., columnar=True) 的结果构造"""
+        if not columns:
+            return cls.empty()
+        data = {}
+        for name, values in zip(SESSION_COLUMNS, columns):
+            typecode = COLUMN_TYPECODES.get(name)
+            data[name] = _compact_column(typecode, values) if typecode else tuple(values)
+        return cls(data, len(columns[0]))
+
+    @classmethod
+    def from_dicts(cls, rows: List[Dict[str, Any]]) -> "SessionBlock":
+        """由显示格式的会话字典构造（用于模拟数据）"""
+        columns = []
+        for name in SESSION_COLUMNS:
+            values = [row[name] for row in rows]
+            if name in IP_COLUMNS:
+                values = [parse_ip(v) for v in values]
+            elif name in TIME_COLUMNS:
+                values = [int(datetime.strptime(v, '%Y-%m-%d %H:%M:%S').timestamp() * 1000) for v in values]
+            elif name == 'tcp_flags':
+                values = [int(v) if v else 0 for v in values]
+            columns.append(values)
+        return cls.from_columns(columns) if rows else cls.empty()
+
+    @classmethod
+    def empty(cls) -> "SessionBlock":
+        return cls({name: array(COLUMN_TYPECODES[name]) if name in COLUMN_TYPECODES else ()
+                    for name in SESSION_COLUMNS}, 0)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, item: slice) -> "SessionBlock":
+        columns = {name: values[item] for name, values in self.columns.items()}
+        return SessionBlock(columns, len(columns['timestamp']))
+
+    def iter_rows(self, raw: bool = False) -> Iterator[Dict[str, Any]]:
+        """逐行生成会话字典；raw=True 时时间为毫秒时间戳、tcp_flags为整数，交给客户端格式化"""
+        names = SESSION_COLUMNS
+        columns = [self.columns[name] for name in names]
+        converters = []
+        for name in names:
+            if name in IP_COLUMNS:
+                converters.append(format_ip)
+            elif name in TIME_COLUMNS:
+                converters.append(None if raw else format_ms)
+            elif name == 'tcp_flags':
+                converters.append(None if raw else str)
+            else:
+                converters.append(None)
+        for values in zip(*columns):
+            yield {name: (convert(value) if convert else value)
+                   for name, value, convert in zip(names, values, converters)}
+
+    def to_dicts(self, raw: bool = False) -> List[Dict[str, Any]]:
+        return list(self.iter_rows(raw))
+
+    def iter_json(self, raw: bool = False, chunk_rows: int = 500) -> Iterator[bytes]:
+        """分块序列化为JSON数组"""
+        yield b"["
+        chunk: List[str] = []
+        first = True
+        for row in self.iter_rows(raw):
+            chunk.append(json.dumps(row, ensure_ascii=False))
+            if len(chunk) >= chunk_rows:
+                yield (("" if first else ",") + ",".join(chunk)).encode("utf-8")
+                chunk, first = [], False
+        if chunk:
+            yield (("" if first else ",") + ",".join(chunk)).encode("utf-8")
+        yield b"]"
+
+    def first(self, raw: bool = False) -> Optional[Dict[str, Any]]:
+        return next(self.iter_rows(raw), None)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.cache import TTLCache
+from app.services.request_context import current_username
+
+logger = logging.getLogger(__name__)
+
+# 慢查询阈值（毫秒）、内存环形缓冲区大小、日志文件及轮转配置
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "1000"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "5"))
+# 同一SQL模板在该时间内只采集一次EXPLAIN（秒）
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+# 非慢查询按比例抽样记录日志
+QUERY_LOG_SAMPLE_RATE = float(os.getenv("QUERY_LOG_SAMPLE_RATE", "0.01"))
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """将字面量替换为?并压缩空白，得到SQL模板"""
+    normalized = _STRING_LITERAL.sub("?", query)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def extract_literals(query: str) -> List[str]:
+    """提取SQL中的字面量（内联参数），与normalize_sql的?按类型分组对应"""
+    strings = _STRING_LITERAL.findall(query)
+    numbers = _NUMBER_LITERAL.findall(_STRING_LITERAL.sub("?", query))
+    return strings + numbers
+
+
+class SlowQueryLog:
+    """慢查询记录器：内存环形缓冲区 + 轮转日志文件，并为慢查询采集执行计划"""
+
+    def __init__(self,
+                 threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+                 buffer_size: int = SLOW_QUERY_BUFFER_SIZE,
+                 log_file: Optional[str] = SLOW_QUERY_LOG_FILE,
+                 sample_rate: float = QUERY_LOG_SAMPLE_RATE):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.log_file = log_file
+        self._entries: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._explained = TTLCache(maxsize=1000, ttl=SLOW_QUERY_EXPLAIN_INTERVAL)
+        self._file_logger: Optional[logging.Logger] = None
+
+    def _get_file_logger(self) -> Optional[logging.Logger]:
+        if not self.log_file:
+            return None
+        if self._file_logger is None:
+            file_logger = logging.getLogger("slow_query")
+            file_logger.propagate = False
+            file_logger.setLevel(logging.INFO)
+            if not file_logger.handlers:
+                handler = RotatingFileHandler(
+                    self.log_file, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                    backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+                )
+                file_logger.addHandler(handler)
+            self._file_logger = file_logger
+        return self._file_logger
+
+    def observe(self,
+                name: str,
+                query: str,
+                params: Optional[Dict[str, Any]],
+                elapsed: float,
+                query_id: str,
+                rows_read: Optional[int] = None,
+                bytes_read: Optional[int] = None,
+                error: Optional[str] = None,
+                explain: Optional[Callable[[], List[str]]] = None) -> None:
+        """记录一次查询；超过阈值或失败的查询写入慢查询日志，其余按比例抽样输出"""
+        elapsed_ms = elapsed * 1000
+        if error is None and elapsed_ms < self.threshold_ms:
+            if self.sample_rate > 0 and random.random() < self.sample_rate:
+                logger.info(f"Query {name} [{query_id}] {elapsed_ms:.1f}ms rows_read={rows_read}")
+            return
+
+        normalized = normalize_sql(query)
+        fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+        plan = None
+        if explain is not None and error is None and self._explained.get(fingerprint) is None:
+            self._explained.set(fingerprint, True)
+            try:
+                plan = explain()
+            except Exception as e:
+                plan = [f"EXPLAIN failed: {e}"]
+
+        entry = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "query_id": query_id,
+            "name": name,
+            "fingerprint": fingerprint,
+            "sql": normalized,
+            "params": params or {},
+            "literals": extract_literals(query),
+            "user": current_username(),
+            "elapsed_ms": round(elapsed_ms, 1),
+            "rows_read": rows_read,
+            "bytes_read": bytes_read,
+            "error": error,
+            "explain": plan
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        logger.warning(f"Slow query {name} [{query_id}] {elapsed_ms:.1f}ms"
+                       + (f" error={error}" if error else ""))
+        file_logger = self._get_file_logger()
+        if file_logger is not None:
+            try:
+                file_logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+            except Exception as e:
+                logger.error(f"Failed to write slow query log: {e}")
+
+    def entries(self, limit: int = 50, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间倒序返回最近的慢查询"""
+        with self._lock:
+            items = list(self._entries)
+        if name:
+            items = [e for e in items if e["name"] == name]
+        return items[::-1][:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,106 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """查询结果快照：每个保存的查询一个目录，每个快照一个gzip压缩的JSON文件
+
+    文件名以生成时间（毫秒）开头，按文件名排序即按时间排序；写入先写临时文件再rename，
+    多个worker进程可以同时读取。
+    """
+
+    def __init__(self, directory: str, retention: int = 7, max_age_days: float = 30):
+        self.directory = directory
+        self.retention = retention
+        self.max_age_days = max_age_days
+
+    def _dir(self, query_id: int) -> str:
+        return os.path.join(self.directory, str(int(query_id)))
+
+    def _files(self, query_id: int) -> List[str]:
+        try:
+            names = os.listdir(self._dir(query_id))
+        except FileNotFoundError:
+            return []
+        return sorted((n for n in names if n.endswith(".json.gz")), reverse=True)
+
+    def save(self, query_id: int, meta: Dict[str, Any], payload: Any) -> Dict[str, Any]:
+        """保存快照，返回快照元数据；清理旧快照由调用方按各查询的保留数调用 prune"""
+        directory = self._dir(query_id)
+        os.makedirs(directory, exist_ok=True)
+        created_ms = int(time.time() * 1000)
+        meta = dict(meta, created_ms=created_ms)
+        fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(json.dumps({"meta": meta, "payload": payload}, ensure_ascii=False, default=str).encode("utf-8"))
+            os.replace(tmp_path, os.path.join(directory, f"{created_ms}.json.gz"))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return meta
+
+    def _read(self, query_id: int, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with gzip.open(os.path.join(self._dir(query_id), name), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to read snapshot {query_id}/{name}: {e}")
+            return None
+
+    def latest(self, query_id: int) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """最新的快照 (meta, payload)，没有时返回None"""
+        for name in self._files(query_id):
+            snapshot = self._read(query_id, name)
+            if snapshot is not None:
+                return snapshot["meta"], snapshot["payload"]
+        return None
+
+    def latest_time(self, query_id: int) -> Optional[int]:
+        """最新快照的生成时间（毫秒），只读取文件名"""
+        files = self._files(query_id)
+        return int(files[0].split(".", 1)[0]) if files else None
+
+    def list(self, query_id: int) -> List[Dict[str, Any]]:
+        """快照列表（不含结果数据），按时间倒序"""
+        items = []
+        for name in self._files(query_id):
+            path = os.path.join(self._dir(query_id), name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            items.append({"created_ms": int(name.split(".", 1)[0]), "size_bytes": size})
+        return items
+
+    def prune(self, query_id: int, retention: Optional[int] = None) -> int:
+        """只保留最近的若干个快照，并删除超过最长保留时间的快照，返回删除数量"""
+        keep = self.retention if retention is None else retention
+        cutoff_ms = (time.time() - self.max_age_days * 86400) * 1000
+        removed = 0
+        for index, name in enumerate(self._files(query_id)):
+            # 最新的快照始终保留
+            if index == 0 or (index < keep and int(name.split(".", 1)[0]) >= cutoff_ms):
+                continue
+            try:
+                os.unlink(os.path.join(self._dir(query_id), name))
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def delete(self, query_id: int) -> None:
+        shutil.rmtree(self._dir(query_id), ignore_errors=True)
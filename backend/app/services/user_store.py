@@ -0,0 +1,16 @@
+from typing import Dict, Optional
+
+from app.services.json_store import JsonStore
+
+
+class UserStore(JsonStore):
+    """用户存储：按用户名和ID建立索引，多个worker进程共享同一个用户文件"""
+
+    duplicate_message = "Username already exists"
+
+    def __init__(self, path: str, default_users: Optional[Dict[str, dict]] = None,
+                 check_interval: float = 1.0):
+        super().__init__(path, key_field="username", defaults=default_users, check_interval=check_interval)
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return self.get_by_key(username)
@@ -0,0 +1,205 @@
+"""flow_stats 合成数据生成器
+
+数据在ClickHouse内部通过 INSERT ... SELECT FROM numbers() 生成，规模可以到10^9行；
+所有随机量都由 cityHash64(number, seed, k) 派生，相同的 --seed 和 --rows 得到完全相同的数据。
+
+分布：源主机按幂律偏斜（少数主机产生大部分会话），目的端口/应用按常见服务加权，
+字节数和持续时间服从对数正态分布，时间戳在 --days 天内均匀递增。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.flowgen --rows 1000000                  # 写入本地ClickHouse
+    python -m benchmarks.flowgen --rows 1000000 --engine chdb    # 写入嵌入式chdb目录
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+SERVICES = [
+    # (端口, 协议号, 协议名, 应用名)，越靠前出现概率越高
+    (443, 6, "HTTPS", "TLS Web"),
+    (80, 6, "HTTP", "Web Browsing"),
+    (53, 17, "DNS", "DNS Query"),
+    (22, 6, "SSH", "SSH"),
+    (3389, 6, "RDP", "Remote Desktop"),
+    (445, 6, "SMB", "File Sharing"),
+    (123, 17, "NTP", "Time Sync"),
+    (8080, 6, "HTTP", "Web Proxy"),
+    (25, 6, "SMTP", "Mail"),
+    (3306, 6, "MySQL", "Database"),
+]
+DOMAIN_SUFFIXES = ["example.com", "cdn.net", "corp.local", "cloud.io", "api.dev"]
+
+SESSION_COLUMNS = [
+    "timestamp", "src_ip", "dst_ip", "src_port", "dst_port", "protocol",
+    "total_packets", "total_bytes", "up_packets", "up_bytes", "down_packets", "down_bytes",
+    "duration", "avg_pps", "avg_bps", "min_packet_size", "max_packet_size", "avg_packet_size",
+    "protocol_name", "protocol_confidence", "app_name", "app_confidence", "matched_domain",
+    "first_seen", "last_seen", "tcp_flags", "retransmissions", "out_of_order", "lost_packets",
+]
+
+
+def create_table_sql(database: str, table: str) -> str:
+    return f"""
+    CREATE TABLE IF NOT EXISTS {database}.{table}
+    (
+        timestamp UInt64,
+        src_ip String,
+        dst_ip String,
+        src_port UInt16,
+        dst_port UInt16,
+        protocol UInt8,
+        total_packets UInt64,
+        total_bytes UInt64,
+        up_packets UInt64,
+        up_bytes UInt64,
+        down_packets UInt64,
+        down_bytes UInt64,
+        duration Float64,
+        avg_pps Float64,
+        avg_bps Float64,
+        min_packet_size UInt32,
+        max_packet_size UInt32,
+        avg_packet_size Float64,
+        protocol_name LowCardinality(String),
+        protocol_confidence UInt8,
+        app_name LowCardinality(String),
+        app_confidence UInt8,
+        matched_domain String,
+        first_seen UInt64,
+        last_seen UInt64,
+        tcp_flags UInt8,
+        retransmissions UInt32,
+        out_of_order UInt32,
+        lost_packets UInt32
+    )
+    ENGINE = MergeTree
+    PARTITION BY toYYYYMMDD(toDateTime(intDiv(timestamp, 1000)))
+    ORDER BY timestamp
+    """
+
+
+def _u(seed: int, k: int) -> str:
+    """第k个[0,1)均匀随机量"""
+    return f"(cityHash64(number, {seed}, {k}) % 1000000) / 1000000.0"
+
+
+def _normal(seed: int, k1: int, k2: int) -> str:
+    """Box-Muller变换得到标准正态随机量"""
+    return f"(sqrt(-2 * log({_u(seed, k1)} + 1e-9)) * cos(2 * pi() * {_u(seed, k2)}))"
+
+
+def insert_select_sql(database: str, table: str, total_rows: int, offset: int, count: int,
+                      start_ms: int, span_ms: int, seed: int,
+                      src_hosts: int = 5000, dst_hosts: int = 50000, domains: int = 2000) -> str:
+    """生成第 [offset, offset+count) 行的 INSERT ... SELECT 语句"""
+    ports = [s[0] for s in SERVICES]
+    protocols = [s[1] for s in SERVICES]
+    protocol_names = [s[2] for s in SERVICES]
+    app_names = [s[3] for s in SERVICES]
+    n_services = len(SERVICES)
+
+    return f"""
+    INSERT INTO {database}.{table} ({", ".join(SESSION_COLUMNS)})
+    SELECT {", ".join(SESSION_COLUMNS)}
+    FROM
+    (
+        SELECT
+            {start_ms} + intDiv(number * {span_ms}, {total_rows}) AS timestamp,
+            toUInt32(pow({_u(seed, 1)}, 3) * {src_hosts}) AS src_host,
+            IPv4NumToString(toUInt32(167772160 + src_host)) AS src_ip,
+            if({_u(seed, 2)} < 0.2,
+               IPv4NumToString(toUInt32(167772160 + toUInt32(pow({_u(seed, 3)}, 2) * {src_hosts}))),
+               IPv4NumToString(toUInt32(134217728 + toUInt32(pow({_u(seed, 3)}, 4) * {dst_hosts}) * 7))) AS dst_ip,
+            least({n_services}, 1 + toUInt8(floor(pow({_u(seed, 4)}, 2.2) * {n_services}))) AS svc,
+            toUInt16(1024 + cityHash64(number, {seed}, 5) % 64511) AS src_port,
+            toUInt16(arrayElement({ports}, svc)) AS dst_port,
+            toUInt8(arrayElement({protocols}, svc)) AS protocol,
+            toUInt64(least(1e10, exp(7 + 2.2 * {_normal(seed, 6, 7)}))) AS total_bytes,
+            greatest(toUInt64(1), toUInt64(total_bytes / (200 + 1200 * {_u(seed, 8)}))) AS total_packets,
+            0.1 + 0.5 * {_u(seed, 9)} AS up_fraction,
+            toUInt64(total_bytes * up_fraction) AS up_bytes,
+            total_bytes - up_bytes AS down_bytes,
+            toUInt64(total_packets * up_fraction) AS up_packets,
+            total_packets - up_packets AS down_packets,
+            round(least(3600, exp(0.5 + 2 * {_normal(seed, 10, 11)})), 3) AS duration,
+            total_packets / greatest(duration, 0.001) AS avg_pps,
+            total_bytes * 8 / greatest(duration, 0.001) AS avg_bps,
+            toUInt32(40 + 60 * {_u(seed, 12)}) AS min_packet_size,
+            toUInt32(1300 + 200 * {_u(seed, 13)}) AS max_packet_size,
+            total_bytes / total_packets AS avg_packet_size,
+            arrayElement({protocol_names}, svc) AS protocol_name,
+            toUInt8(60 + 40 * {_u(seed, 14)}) AS protocol_confidence,
+            arrayElement({app_names}, svc) AS app_name,
+            toUInt8(50 + 50 * {_u(seed, 15)}) AS app_confidence,
+            toUInt32(pow({_u(seed, 16)}, 2) * {domains}) AS domain_id,
+            if(protocol_name IN ('HTTPS', 'HTTP', 'DNS'),
+               concat('host', toString(domain_id), '.', arrayElement({DOMAIN_SUFFIXES}, 1 + domain_id % {len(DOMAIN_SUFFIXES)})),
+               '') AS matched_domain,
+            timestamp - toUInt64(duration * 1000) AS first_seen,
+            timestamp AS last_seen,
+            toUInt8(if(protocol = 6, arrayElement([2, 18, 16, 24, 17, 20], 1 + cityHash64(number, {seed}, 17) % 6), 0)) AS tcp_flags,
+            toUInt32(if({_u(seed, 18)} < 0.05, 50 * {_u(seed, 19)}, 0)) AS retransmissions,
+            toUInt32(if({_u(seed, 20)} < 0.02, 20 * {_u(seed, 21)}, 0)) AS out_of_order,
+            toUInt32(if({_u(seed, 22)} < 0.01, 10 * {_u(seed, 23)}, 0)) AS lost_packets
+        FROM numbers({offset}, {count})
+    )
+    """
+
+
+def generate(client, database: str, table: str, rows: int, days: float = 7, seed: int = 42,
+             end_time: datetime = None, chunk: int = 50_000_000, drop: bool = False) -> None:
+    """创建表并分批生成数据；client 只需提供 execute(query) 方法"""
+    end_time = end_time or datetime.now().replace(minute=0, second=0, microsecond=0)
+    span_ms = int(timedelta(days=days).total_seconds() * 1000)
+    start_ms = int(end_time.timestamp() * 1000) - span_ms
+
+    client.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+    if drop:
+        client.execute(f"DROP TABLE IF EXISTS {database}.{table}")
+    client.execute(create_table_sql(database, table))
+
+    started = time.perf_counter()
+    for offset in range(0, rows, chunk):
+        count = min(chunk, rows - offset)
+        client.execute(insert_select_sql(database, table, rows, offset, count, start_ms, span_ms, seed))
+        done = offset + count
+        elapsed = time.perf_counter() - started
+        print(f"  {done:,}/{rows:,} rows ({done / max(elapsed, 1e-9):,.0f} rows/s)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成 flow_stats 合成数据")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="生成行数（支持10^6~10^9）")
+    parser.add_argument("--days", type=float, default=7, help="数据覆盖的天数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--engine", choices=["clickhouse", "chdb"], default="clickhouse")
+    parser.add_argument("--chdb-path", default=os.getenv("CHDB_PATH", ".bench_chdb"), help="chdb数据目录")
+    parser.add_argument("--database", default=os.getenv("CLICKHOUSE_DATABASE", "traffic_analysis"))
+    parser.add_argument("--table", default=os.getenv("CLICKHOUSE_TABLE", "flow_stats"))
+    parser.add_argument("--end-time", help="数据结束时间 (YYYY-MM-DD HH:MM:SS)，默认当前整点；复现数据时需固定")
+    parser.add_argument("--drop", action="store_true", help="生成前删除已有表")
+    parser.add_argument("--chunk", type=int, default=50_000_000, help="每批生成的行数")
+    args = parser.parse_args(argv)
+
+    if args.engine == "chdb":
+        from benchmarks.standin import ChdbClient
+        client = ChdbClient(args.chdb_path)
+    else:
+        from clickhouse_driver import Client
+        client = Client(
+            host=os.getenv("CLICKHOUSE_HOST", "localhost"),
+            port=int(os.getenv("CLICKHOUSE_PORT", "9000")),
+            user=os.getenv("CLICKHOUSE_USER", "default"),
+            password=os.getenv("CLICKHOUSE_PASSWORD", "")
+        )
+
+    print(f"Generating {args.rows:,} rows into {args.database}.{args.table} ({args.engine})", file=sys.stderr)
+    end_time = datetime.strptime(args.end_time, "%Y-%m-%d %H:%M:%S") if args.end_time else None
+    generate(client, args.database, args.table, args.rows, days=args.days, seed=args.seed,
+             end_time=end_time, chunk=args.chunk, drop=args.drop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""API压测场景
+
+对 FastAPI 应用执行脚本化场景并输出吞吐量与延迟分位数。默认在进程内通过 ASGI 直接调用应用，
+也可以用 --base-url 压测已启动的服务。配合 --engine chdb 可在没有ClickHouse服务时离线运行。
+
+场景：
+    dashboard   仪表盘加载（统计、热门IP、协议分布并发请求）
+    paging      深分页（随机跳转到靠后的页）
+    export      JSON导出
+    analysts    多名分析员混合操作（仪表盘、过滤查询、翻页、会话下钻）
+
+用法（在 backend 目录下）：
+    python -m benchmarks.run --scenario dashboard --iterations 200 --concurrency 10 --output before.json
+    python -m benchmarks.run --scenario dashboard --iterations 200 --concurrency 10 --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import httpx
+
+Sample = Tuple[str, float, int]
+
+
+def _window(context: dict, rng: random.Random, hours: float = 1) -> Dict[str, str]:
+    """在数据时间范围内随机取一个时间窗口"""
+    max_time = context["max_time"]
+    start = max_time - timedelta(hours=rng.uniform(hours, hours * 24))
+    end = start + timedelta(hours=hours)
+    return {"start_time": start.strftime("%Y-%m-%d %H:%M:%S"), "end_time": end.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+async def _get(client: httpx.AsyncClient, label: str, url: str, params: dict = None) -> Tuple[Sample, httpx.Response]:
+    start = time.perf_counter()
+    response = await client.get(url, params=params)
+    return (label, time.perf_counter() - start, response.status_code), response
+
+
+async def scenario_dashboard(client, context, rng) -> List[Sample]:
+    results = await asyncio.gather(
+        _get(client, "stats", "/api/sessions/stats"),
+        _get(client, "top_ips", "/api/sessions/top-ips", {"limit": 5}),
+        _get(client, "protocols", "/api/sessions/protocols"),
+    )
+    return [sample for sample, _ in results]
+
+
+async def scenario_paging(client, context, rng) -> List[Sample]:
+    page = rng.choice([1, 2, 10, 50, 100, 500, 1000])
+    sample, _ = await _get(client, "page", "/api/sessions", {"page": page, "size": 100})
+    return [sample]
+
+
+async def scenario_export(client, context, rng) -> List[Sample]:
+    sample, _ = await _get(client, "export_json", "/api/sessions/export",
+                           dict(_window(context, rng), format="json"))
+    return [sample]
+
+
+async def scenario_analysts(client, context, rng) -> List[Sample]:
+    action = rng.choices(["dashboard", "filter", "paging", "drilldown"], weights=[2, 4, 3, 1])[0]
+    if action == "dashboard":
+        return await scenario_dashboard(client, context, rng)
+    if action == "paging":
+        return await scenario_paging(client, context, rng)
+
+    params = _window(context, rng)
+    if context["top_ips"]:
+        params["src_ip"] = rng.choice(context["top_ips"])
+    sample, response = await _get(client, "filter", "/api/sessions", dict(params, size=50))
+    samples = [sample]
+    if action == "drilldown" and response.status_code == 200 and response.json().get("data"):
+        row = rng.choice(response.json()["data"])
+        flow_params = {k: row[k] for k in ("src_ip", "dst_ip", "src_port", "dst_port", "protocol", "first_seen")}
+        flow_sample, _ = await _get(client, "flow", "/api/sessions/flow", flow_params)
+        samples.append(flow_sample)
+    return samples
+
+
+SCENARIOS = {
+    "dashboard": scenario_dashboard,
+    "paging": scenario_paging,
+    "export": scenario_export,
+    "analysts": scenario_analysts,
+}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Sample], iterations: int, elapsed: float) -> dict:
+    by_label: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for label, latency, status in samples:
+        by_label[label].append(latency)
+        if status >= 400:
+            errors[label] += 1
+
+    labels = {}
+    for label, values in sorted(by_label.items()):
+        values.sort()
+        labels[label] = {
+            "requests": len(values),
+            "errors": errors[label],
+            "p50_ms": round(_percentile(values, 50) * 1000, 2),
+            "p90_ms": round(_percentile(values, 90) * 1000, 2),
+            "p99_ms": round(_percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    return {
+        "iterations": iterations,
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "iterations_per_s": round(iterations / elapsed, 2) if elapsed else 0.0,
+        "requests_per_s": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "labels": labels,
+    }
+
+
+def print_report(result: dict, baseline: dict = None) -> None:
+    def delta(current, previous):
+        if not previous:
+            return ""
+        return f" ({(current - previous) * 100.0 / previous:+.1f}%)"
+
+    summary = result["summary"]
+    base = baseline["summary"] if baseline else {}
+    print(f"scenario={result['scenario']} concurrency={result['concurrency']} "
+          f"iterations={summary['iterations']} elapsed={summary['elapsed_s']}s")
+    print(f"throughput: {summary['iterations_per_s']} it/s{delta(summary['iterations_per_s'], base.get('iterations_per_s'))}, "
+          f"{summary['requests_per_s']} req/s{delta(summary['requests_per_s'], base.get('requests_per_s'))}")
+    print(f"{'label':<14}{'reqs':>7}{'errs':>6}{'p50 ms':>20}{'p90 ms':>20}{'p99 ms':>20}")
+    for label, stats in summary["labels"].items():
+        prev = base.get("labels", {}).get(label, {})
+        cols = [f"{stats[k]}{delta(stats[k], prev.get(k))}" for k in ("p50_ms", "p90_ms", "p99_ms")]
+        print(f"{label:<14}{stats['requests']:>7}{stats['errors']:>6}{cols[0]:>20}{cols[1]:>20}{cols[2]:>20}")
+
+
+async def run(args) -> dict:
+    if args.base_url:
+        transport = None
+        base_url = args.base_url.rstrip("/")
+    else:
+        from main import app
+        if args.engine == "chdb":
+            from app.services.clickhouse_service import get_clickhouse_service
+            from benchmarks.standin import ChdbClient
+            get_clickhouse_service().attach_client(ChdbClient(args.chdb_path))
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+        login = await client.post("/api/auth/login", json={"username": args.username, "password": args.password})
+        login.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+
+        time_range = (await client.get("/api/sessions/time-range")).json()
+        top_ips = (await client.get("/api/sessions/top-ips", params={"limit": 20})).json()
+        max_time = time_range.get("max_time")
+        context = {
+            "max_time": datetime.strptime(max_time, "%Y-%m-%d %H:%M:%S") if max_time else datetime.now(),
+            "top_ips": [item["ip"] for item in top_ips] if isinstance(top_ips, list) else [],
+        }
+
+        scenario = SCENARIOS[args.scenario]
+        rng = random.Random(args.seed)
+        samples: List[Sample] = []
+        remaining = iter(range(args.iterations))
+
+        async def worker(worker_id: int):
+            worker_rng = random.Random(rng.random() + worker_id)
+            for _ in remaining:
+                samples.extend(await scenario(client, context, worker_rng))
+
+        for _ in range(args.warmup):
+            await scenario(client, context, random.Random(args.seed))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "target": args.base_url or f"in-process ({args.engine})",
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": summarize(samples, args.iterations, elapsed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="网络会话分析API压测")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="dashboard")
+    parser.add_argument("--iterations", type=int, default=100, help="场景执行次数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数（模拟分析员数）")
+    parser.add_argument("--warmup", type=int, default=3, help="预热次数（不计入结果）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", help="压测已启动的服务，如 http://localhost:8000；默认进程内调用")
+    parser.add_argument("--engine", choices=["clickhouse", "chdb"], default="clickhouse",
+                        help="进程内模式使用的数据源")
+    parser.add_argument("--chdb-path", default=os.getenv("CHDB_PATH", ".bench_chdb"))
+    parser.add_argument("--username", default=os.getenv("BENCH_USERNAME", "admin"))
+    parser.add_argument("--password", default=os.getenv("BENCH_PASSWORD", "admin123"))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前保存的JSON结果对比")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""嵌入式ClickHouse替身
+
+用 chdb（进程内ClickHouse引擎）实现与 clickhouse_driver.Client 相同的 execute 接口，
+使压测可以在没有ClickHouse服务的机器上离线运行，并走完整的SQL与结果转换路径。
+"""
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from clickhouse_driver.context import Context
+from clickhouse_driver.util.escape import escape_param, escape_params
+
+
+def _convert(value, type_name: str):
+    """按列类型把JSON值转换为clickhouse_driver返回的Python类型"""
+    if value is None:
+        return None
+    base = type_name
+    for wrapper in ("Nullable(", "LowCardinality("):
+        if base.startswith(wrapper):
+            base = base[len(wrapper):-1]
+    if base.startswith(("UInt", "Int")):
+        return int(value)
+    if base.startswith(("Float", "Decimal")):
+        return float(value)
+    if base.startswith("DateTime") and isinstance(value, str):
+        return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+    return value
+
+
+class ChdbClient:
+    """兼容 clickhouse_driver.Client.execute 的 chdb 客户端"""
+
+    def __init__(self, path: str):
+        from chdb import session
+        self._session = session.Session(path)
+        self._context = Context()
+        self.last_query = None
+
+    def execute(self, query: str, params=None, query_id=None, columnar=False, **kwargs):
+        if isinstance(params, (list, tuple)):
+            # INSERT ... VALUES 的数据行
+            query = query + " " + ", ".join(
+                "(" + ", ".join(str(escape_param(v, self._context)) for v in row) + ")" for row in params)
+        elif params is not None:
+            query = query % escape_params(params, self._context)
+
+        stripped = query.lstrip().upper()
+        if not stripped.startswith(("SELECT", "WITH", "EXPLAIN", "SHOW", "DESCRIBE")):
+            self._session.query(query)
+            self.last_query = SimpleNamespace(progress=SimpleNamespace(rows=0, bytes=0))
+            return []
+
+        result = self._session.query(query, "JSONCompact")
+        raw = result.bytes() if hasattr(result, "bytes") else str(result).encode()
+        payload = json.loads(raw) if raw.strip() else {"meta": [], "data": []}
+        types = [column["type"] for column in payload.get("meta", [])]
+        rows = [tuple(_convert(v, t) for v, t in zip(row, types)) for row in payload.get("data", [])]
+
+        statistics = payload.get("statistics", {})
+        self.last_query = SimpleNamespace(progress=SimpleNamespace(
+            rows=int(statistics.get("rows_read", 0)),
+            bytes=int(statistics.get("bytes_read", 0))
+        ))
+        if columnar:
+            return [tuple(column) for column in zip(*rows)]
+        return rows
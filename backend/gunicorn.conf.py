@@ -0,0 +1,23 @@
+"""生产环境 gunicorn 配置：gunicorn -c gunicorn.conf.py main:app"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# 在master进程中加载应用，worker通过fork共享只读内存；
+# ClickHouse连接在首次查询/预热时建立，不跨进程共享
+preload_app = os.getenv("PRELOAD_APP", "True").lower() == "true"
+
+# 收到SIGTERM后等待进行中的请求完成
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# 定期重启worker，避免长期运行的内存增长
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
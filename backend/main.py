@@ -1,14 +1,29 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import logging
 import os
+import re
+import time
 from dotenv import load_dotenv
 
 # 导入路由
 from app.api.sessions import router as sessions_router
 from app.api.users import router as users_router
+from app.api.admin import router as admin_router
+from app.api.saved_queries import router as saved_queries_router
+from app.api.query import router as query_router
+from app.api.anomalies import router as anomalies_router
+from app.services.metrics import registry, http_request_duration, http_requests_in_flight
+from app.services.request_context import request_id_var, request_state_var, new_request_id
+from app.services.profiling import PROFILE_HEADER, start_profile, finish_profile
+from app.services.clickhouse_service import get_clickhouse_service
+from app.services.compression import CompressionMiddleware
+from app.services.saved_queries import saved_query_service
+from app.services.anomaly_detector import anomaly_detector
 
 # 加载环境变量
 load_dotenv()
@@ -43,14 +58,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Request-ID", "Server-Timing"],
 )
 
+# 响应压缩（按 Accept-Encoding 协商 zstd/br/gzip）
+app.add_middleware(CompressionMiddleware)
+
+# 请求指标与请求ID
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """记录请求耗时，并为请求分配ID（透传到ClickHouse的query_id）；
+    按请求头或抽样剖析请求，管理员请求在 Server-Timing 中返回各阶段耗时；
+    Server-Timing 随响应头发出，流式响应体发送期间的阶段只记录在剖析结果中"""
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = new_request_id()
+    token = request_id_var.set(request_id)
+    profile = start_profile(request_id, request.method, request.url.path, request.headers.get(PROFILE_HEADER))
+    state_token = request_state_var.set({"user": None, "profile": profile})
+    http_requests_in_flight.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        if profile is not None:
+            profile.headers_sent = time.perf_counter()
+            if profile.allowed:
+                response.headers["Server-Timing"] = profile.server_timing()
+            response.body_iterator = _profiled_body(response.body_iterator, profile)
+            profile = None
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_duration.observe(
+            time.perf_counter() - start,
+            method=request.method, route=route, status=status_code
+        )
+        http_requests_in_flight.dec()
+        request_state_var.reset(state_token)
+        request_id_var.reset(token)
+        if profile is not None:
+            finish_profile(profile)
+
+async def _profiled_body(body_iterator, profile):
+    """响应体发送完成后结束剖析（流式响应的生成时间计入 body）"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        finish_profile(profile)
+
 # 全局异常处理器
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -70,6 +138,33 @@ async def health_check():
         "message": "Network Session Analysis API is running"
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """存活检查：进程可以响应请求即返回200"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪检查：预热完成且ClickHouse可以响应查询时返回200，否则返回503"""
+    service = get_clickhouse_service()
+    # 连接池存在不代表服务端仍可用，需实际执行一次查询
+    connected = await run_in_threadpool(lambda: service.ensure_connected() and service.ping())
+    ready = warmup_state["done"] and connected
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "clickhouse": "connected" if connected else "unavailable",
+            "pool": service.pool.stats() if service.pool else None,
+            "warmup": warmup_state
+        }
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -82,6 +177,14 @@ async def root():
 # 注册路由
 app.include_router(sessions_router, prefix="/api", tags=["sessions"])
 app.include_router(users_router, prefix="/api", tags=["users"])
+app.include_router(admin_router, prefix="/api", tags=["admin"])
+app.include_router(saved_queries_router, prefix="/api", tags=["saved-queries"])
+app.include_router(query_router, prefix="/api", tags=["query"])
+app.include_router(anomalies_router, prefix="/api", tags=["anomalies"])
+
+# 启动预热状态（/health/ready 在预热完成前返回503）
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+warmup_state = {"done": False, "result": None, "error": None}
 
 # 启动事件
 @app.on_event("startup")
@@ -90,21 +193,42 @@ async def startup_event():
     logger.info(f"ClickHouse Host: {os.getenv('CLICKHOUSE_HOST', 'localhost')}")
     logger.info(f"API Server Port: {os.getenv('PORT', '8000')}")
 
+    # 预热连接池和仪表盘查询缓存，超时后仍然启动，由就绪检查反映状态
+    try:
+        warmup_state["result"] = await asyncio.wait_for(
+            run_in_threadpool(get_clickhouse_service().warmup), timeout=WARMUP_TIMEOUT
+        )
+        logger.info(f"Warmup finished: {warmup_state['result']}")
+    except Exception as e:
+        warmup_state["error"] = str(e) or type(e).__name__
+        logger.warning(f"Warmup failed: {warmup_state['error']}")
+    warmup_state["done"] = True
+
+    # 保存的查询按调度在后台预先执行
+    saved_query_service.start()
+    # 后台增量异常检测
+    anomaly_detector.start()
+
 @app.on_event("shutdown") 
 async def shutdown_event():
     logger.info("Network Session Analysis API shutting down...")
+    await run_in_threadpool(saved_query_service.stop)
+    await run_in_threadpool(anomaly_detector.stop)
 
 if __name__ == "__main__":
     import uvicorn
     
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    debug = os.getenv("DEBUG", "True").lower() == "true"
+    debug = os.getenv("DEBUG", "False").lower() == "true"
+    # 生产环境建议使用 gunicorn -c gunicorn.conf.py main:app
+    workers = 1 if debug else int(os.getenv("WORKERS", "1"))
     
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=debug,
+        workers=workers,
         log_level="info"
     )
\ No newline at end of file
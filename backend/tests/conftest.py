@@ -0,0 +1,45 @@
+"""测试环境：隔离用户/保存的查询等文件，关闭后台线程；需要数据的测试使用 chdb 替身生成的小数据集"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_tmp = tempfile.mkdtemp(prefix="backend-tests-")
+for name, value in {
+    "USERS_FILE": os.path.join(_tmp, "users.json"),
+    "SAVED_QUERIES_FILE": os.path.join(_tmp, "saved_queries.json"),
+    "SNAPSHOT_DIR": os.path.join(_tmp, "snapshots"),
+    "ANOMALY_STATE_FILE": os.path.join(_tmp, "anomaly_state.json.gz"),
+    "PROFILE_DIR": os.path.join(_tmp, "profiles"),
+    "SLOW_QUERY_LOG_FILE": os.path.join(_tmp, "slow_queries.log"),
+    "CLICKHOUSE_PORT": "1",
+    "ANOMALY_ENABLED": "False",
+    "SCHEDULER_ENABLED": "False",
+    "BCRYPT_ROUNDS": "4",
+}.items():
+    os.environ.setdefault(name, value)
+
+# 固定数据结束时间，结果可复现
+DATA_END = datetime(2024, 6, 2, 0, 0, 0)
+DATA_ROWS = 20000
+DATA_DAYS = 2
+
+
+@pytest.fixture(scope="session")
+def service():
+    """接入 chdb 替身的 ClickHouseService（未安装 chdb 时跳过）"""
+    pytest.importorskip("chdb")
+    from benchmarks.flowgen import generate
+    from benchmarks.standin import ChdbClient
+    from app.services.clickhouse_service import get_clickhouse_service
+
+    svc = get_clickhouse_service()
+    client = ChdbClient(os.path.join(_tmp, "chdb"))
+    generate(client, svc.database, svc.table, DATA_ROWS, days=DATA_DAYS, end_time=DATA_END, drop=True)
+    svc.attach_client(client)
+    return svc
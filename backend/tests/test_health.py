@@ -0,0 +1,27 @@
+"""就绪检查"""
+import asyncio
+import json
+
+import main
+
+
+def _ready(monkeypatch):
+    monkeypatch.setitem(main.warmup_state, "done", True)
+    response = asyncio.run(main.readiness_check())
+    return response.status_code, json.loads(response.body)
+
+
+def test_ready_when_clickhouse_answers(service, monkeypatch):
+    status, body = _ready(monkeypatch)
+    assert status == 200 and body["clickhouse"] == "connected"
+
+
+def test_not_ready_when_pooled_server_stops_answering(service, monkeypatch):
+    def broken(query, *args, **kwargs):
+        raise ConnectionError("server gone")
+    with service.pool.connection() as client:
+        monkeypatch.setattr(client, "execute", broken)
+    # 连接池仍在，但查询失败
+    assert service.available
+    status, body = _ready(monkeypatch)
+    assert status == 503 and body["clickhouse"] == "unavailable"
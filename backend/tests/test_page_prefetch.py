@@ -0,0 +1,38 @@
+"""会话列表翻页预读"""
+from app.services.page_prefetch import PagePrefetcher
+
+PAGE = 20
+
+
+def _paginate(service, monkeypatch, pages):
+    """按页序列翻页，返回每页是否查询了ClickHouse"""
+    queried = []
+    original = service._session_block
+
+    def counting(*args, **kwargs):
+        queried[-1] = True
+        return original(*args, **kwargs)
+    monkeypatch.setattr(service, "_session_block", counting)
+    for page in pages:
+        queried.append(False)
+        result = service.get_session_data(limit=PAGE, offset=(page - 1) * PAGE, user="pager", app_name="TLS Web")
+        assert len(result["data"]) == PAGE
+    return queried
+
+
+def test_jump_then_sequential_paging_prefetches_again(service, monkeypatch):
+    service.page_prefetcher.clear()
+    _paginate(service, monkeypatch, [1, 10])
+    queried = _paginate(service, monkeypatch, range(50, 56))
+    # 跳页后预读缩小但不为0：顺序翻页时预读重新扩大，6页只需3次查询（50、52、55）
+    assert queried == [True, False, True, False, False, True]
+
+
+def test_window_never_drops_below_one():
+    prefetcher = PagePrefetcher(initial_pages=1)
+    rows = list(range(PAGE * 2))
+    prefetcher.store("u", "k", 1, 0, rows, 1000)
+    for offset in (500, 700, 900):
+        assert prefetcher.get_page("u", "k", 1, offset, PAGE) is None
+        prefetcher.store("u", "k", 1, offset, rows, 1000)
+        assert prefetcher.fetch_size("u", "k", PAGE) >= 2 * PAGE
@@ -0,0 +1,71 @@
+"""保存的查询：调度失败后的退避重试"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import saved_queries
+from app.services.saved_queries import SavedQueryService, retry_delay_ms
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(saved_queries, "SCHEDULER_RETRY_BASE", 60)
+    service = SavedQueryService(str(tmp_path / "queries.json"), str(tmp_path / "snapshots"))
+    query = service.store.create("hourly", {"kind": "stats", "schedule": "1h", "filters": {}})
+    return service, query["id"]
+
+
+def _age_failure(service, query_id, seconds):
+    """把上次失败时间提前，模拟经过了 seconds 秒"""
+    failed = datetime.strptime(service.store.get_by_id(query_id)["last_error_time"], FORMAT)
+    service.store.update(query_id, {"last_error_time": (failed - timedelta(seconds=seconds)).strftime(FORMAT)})
+
+
+def test_failing_query_backs_off(scheduler, monkeypatch):
+    service, query_id = scheduler
+    calls = []
+
+    def fail(query):
+        calls.append(query["id"])
+        raise RuntimeError("timeout")
+    monkeypatch.setattr(service, "execute", fail)
+
+    assert service.run_due() == []  # 失败不计为已执行
+    assert len(calls) == 1
+    query = service.store.get_by_id(query_id)
+    assert query["failures"] == 1 and query["last_error"] == "timeout"
+    assert service.snapshots.latest_time(query_id) is None
+
+    # 下一个调度周期内不会每次检查都重新执行
+    for _ in range(5):
+        service.run_due()
+    assert len(calls) == 1
+
+    _age_failure(service, query_id, 61)
+    service.run_due()
+    assert len(calls) == 2  # 第1次重试：60秒后
+    _age_failure(service, query_id, 61)
+    service.run_due()
+    assert len(calls) == 2  # 第2次重试需要等待120秒
+    _age_failure(service, query_id, 60)
+    service.run_due()
+    assert len(calls) == 3
+    assert service.store.get_by_id(query_id)["failures"] == 3
+
+    # 成功后清除失败记录，恢复按调度周期执行
+    monkeypatch.setattr(service, "execute", lambda query: ({"query_id": query["id"], "elapsed_ms": 1.0}, {}))
+    _age_failure(service, query_id, 240)
+    assert service.run_due() == [query_id]
+    query = service.store.get_by_id(query_id)
+    assert query["failures"] == 0 and query["last_error"] is None
+    assert service.run_due() == []
+
+
+def test_retry_delay_capped_by_schedule(monkeypatch):
+    monkeypatch.setattr(saved_queries, "SCHEDULER_RETRY_BASE", 60)
+    assert retry_delay_ms("15m", 1) == 60 * 1000
+    assert retry_delay_ms("15m", 3) == 240 * 1000
+    assert retry_delay_ms("15m", 20) == 15 * 60 * 1000
+    assert retry_delay_ms("07:30", 30) == 24 * 3600 * 1000
@@ -0,0 +1,46 @@
+"""会话列式存储"""
+from array import array
+
+from app.services.session_block import SESSION_COLUMNS, SessionBlock
+
+TCP_FLAGS = SESSION_COLUMNS.index('tcp_flags')
+
+
+def _row(**overrides):
+    row = {name: 0 for name in SESSION_COLUMNS}
+    row.update(src_ip="10.0.0.1", dst_ip="10.0.0.2", app_name="TLS Web", app_category="Web",
+               avg_packet_size=1.0, duration=1.0, tcp_flags="24")
+    row.update(overrides)
+    return row
+
+
+def test_values_outside_typecode_range_are_kept():
+    rows = [_row(tcp_flags=256, app_confidence=-1, dst_port=70000, lost_packets=None, duration=None),
+            _row(tcp_flags=2, retransmissions=2 ** 40)]
+    columns = [[row[name] for row in rows] for name in SESSION_COLUMNS]
+    columns[SESSION_COLUMNS.index('src_ip')] = [167772161, 167772162]
+    columns[SESSION_COLUMNS.index('dst_ip')] = [167772162, 167772161]
+    block = SessionBlock.from_columns(columns)
+    # 放得下的列仍为紧凑数组
+    assert isinstance(block.columns['src_port'], array)
+    first, second = block.to_dicts(raw=True)
+    assert (first['tcp_flags'], first['app_confidence'], first['dst_port']) == (256, -1, 70000)
+    assert first['lost_packets'] is None and first['duration'] is None
+    assert second['retransmissions'] == 2 ** 40
+    assert block[1:].first(raw=True)['tcp_flags'] == 2
+
+
+def test_session_data_not_replaced_by_mock_on_wide_values(service, monkeypatch):
+    service.page_prefetcher.clear()
+    original = service._query
+
+    def widened(name, query, params=None, columnar=False):
+        result = original(name, query, params, columnar=columnar)
+        if name == "session_data":
+            result = list(result)
+            result[TCP_FLAGS] = [256] * len(result[TCP_FLAGS])
+        return result
+    monkeypatch.setattr(service, "_query", widened)
+    result = service.get_session_data(limit=5, user="wide", app_name="TLS Web")
+    assert [session["tcp_flags"] for session in result["data"]] == ["256"] * 5
+    assert all(session["app_name"] == "TLS Web" for session in result["data"])